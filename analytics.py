@@ -0,0 +1,289 @@
+"""Rolling market analytics per collection.
+
+Every new sale and listing the tracker sees, and a floor reading every
+minute, goes into fixed-size NumPy ring buffers. Memory stays constant, and
+the oldest rows are overwritten once a buffer is full. The buffers are saved
+with ``np.savez`` to ``data/market-<slug>.npz`` every few minutes and on
+shutdown, and loaded again on start.
+
+Aggregations are vectorized over the buffers:
+
+- sales count, volume and VWAP
+- median sale price per rarity tier
+- listings-to-sales ratio
+- floor change
+
+They are computed for 1h, 24h and 7d windows. ``/stats`` answers from here
+without an API call::
+
+    python analytics.py show koru
+    python analytics.py bench [--rows 200000]
+"""
+import argparse
+import logging
+import os
+import time
+import zipfile
+
+import numpy as np
+
+from metadata_cache import DATA_DIR
+from metrics import Gauge
+from rarity_index import NO_TIER, TIER_CODES, TIERS
+
+WINDOWS = (("1h", 3600), ("24h", 86400), ("7d", 7 * 86400))
+
+EVENT_DTYPE = np.dtype([('ts', '<f8'), ('price', '<f8'), ('tier', 'u1')])
+FLOOR_DTYPE = np.dtype([('ts', '<f8'), ('price', '<f8')])
+
+log = logging.getLogger('koru.analytics')
+
+MARKET_ROWS = Gauge('koru_market_rows', "Rows held in the analytics ring buffers", ['collection', 'series'])
+
+
+class RingBuffer:
+    """Fixed-capacity structured array; appends overwrite the oldest rows once full."""
+
+    def __init__(self, capacity, dtype):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.head = 0  # next slot to write
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, rows):
+        rows = np.asarray(rows, dtype=self.data.dtype)
+        n = len(rows)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            rows = rows[-self.capacity:]
+            n = self.capacity
+        end = self.head + n
+        if end <= self.capacity:
+            self.data[self.head:end] = rows
+        else:
+            split = self.capacity - self.head
+            self.data[self.head:] = rows[:split]
+            self.data[:n - split] = rows[split:]
+        self.head = end % self.capacity
+        self.size = min(self.capacity, self.size + n)
+
+    def view(self):
+        """Filled rows, in storage order (not chronological once wrapped)."""
+        return self.data if self.size == self.capacity else self.data[:self.size]
+
+    def ordered(self):
+        """Filled rows, oldest first (a copy)."""
+        if self.size < self.capacity:
+            return self.data[:self.size].copy()
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+    def load(self, rows):
+        self.head = 0
+        self.size = 0
+        self.append(rows)
+
+
+class MarketSeries:
+    """Sales, listings and floor readings for one collection."""
+
+    def __init__(self, slug, path=None, event_capacity=200_000, floor_capacity=50_000):
+        self.slug = slug
+        self.path = path or os.path.join(DATA_DIR, f"market-{slug}.npz")
+        self.sales = RingBuffer(event_capacity, EVENT_DTYPE)
+        self.listings = RingBuffer(event_capacity, EVENT_DTYPE)
+        self.floors = RingBuffer(floor_capacity, FLOOR_DTYPE)
+        self.dirty = False
+        self._cached = None  # (computed_at, version, summary)
+        self._version = 0
+        for name in ('sales', 'listings', 'floors'):
+            MARKET_ROWS.set_function(lambda ring=getattr(self, name): len(ring), collection=slug, series=name)
+
+    def record(self, kind, ts, price, tier=None):
+        if price is None:
+            return
+        ring = self.sales if kind == 'buyNow' else self.listings if kind == 'list' else None
+        if ring is None:
+            return
+        ring.append(np.array([(ts, price, TIER_CODES.get(tier, NO_TIER))], dtype=EVENT_DTYPE))
+        self._changed()
+
+    def record_floor(self, ts, floor_sol):
+        if floor_sol is None:
+            return
+        self.floors.append(np.array([(ts, floor_sol)], dtype=FLOOR_DTYPE))
+        self._changed()
+
+    def _changed(self):
+        self.dirty = True
+        self._version += 1
+
+    def load(self):
+        try:
+            with np.load(self.path) as saved:
+                self.sales.load(saved['sales'])
+                self.listings.load(saved['listings'])
+                self.floors.load(saved['floors'])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError, zipfile.BadZipFile) as e:
+            # Truncated or from an older layout: start empty rather than keep the bot from starting
+            log.error("could not read market analytics", extra={'path': self.path, 'error': str(e)})
+            for ring in (self.sales, self.listings, self.floors):
+                ring.load(np.zeros(0, dtype=ring.data.dtype))
+            return False
+        self._version += 1
+        return True
+
+    def flush(self):
+        if not self.dirty:
+            return False
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, sales=self.sales.ordered(), listings=self.listings.ordered(), floors=self.floors.ordered())
+        os.replace(tmp, self.path)
+        self.dirty = False
+        return True
+
+    def cached_summary(self, max_age=30.0):
+        """``summary()``, reused until new data arrives or it is ``max_age`` seconds old."""
+        now = time.time()
+        cached = self._cached
+        if cached is None or cached[1] != self._version or now - cached[0] > max_age:
+            cached = self._cached = (now, self._version, self.summary(now))
+        return cached[2]
+
+    def summary(self, now=None):
+        """Aggregates for every window in ``WINDOWS``, keyed by window label."""
+        now = now or time.time()
+        sales = self.sales.view()
+        listings = self.listings.view()
+        floors = self.floors.ordered()
+        result = {}
+        for label, seconds in WINDOWS:
+            since = now - seconds
+            in_window = sales['ts'] >= since
+            prices = sales['price'][in_window]
+            tiers = sales['tier'][in_window]
+            count = int(prices.size)
+            volume = float(prices.sum())
+            n_listings = int(np.count_nonzero(listings['ts'] >= since))
+            medians = {}
+            if count:
+                # Sort once by (tier, price); each tier is then a contiguous, sorted run
+                order = np.lexsort((prices, tiers))
+                sorted_tiers, sorted_prices = tiers[order], prices[order]
+                codes, starts, counts = np.unique(sorted_tiers, return_index=True, return_counts=True)
+                # Median of each sorted run straight from its middle element(s)
+                lower = sorted_prices[starts + (counts - 1) // 2]
+                upper = sorted_prices[starts + counts // 2]
+                for code, median in zip(codes, (lower + upper) / 2):
+                    medians[TIERS[code] if code != NO_TIER else 'Unknown'] = float(median)
+            floor_window = floors[floors['ts'] >= since]
+            floor_now = float(floors['price'][-1]) if floors.size else None
+            floor_change = None
+            if floor_window.size >= 2 and floor_window['price'][0]:
+                floor_change = float(floor_window['price'][-1] / floor_window['price'][0] - 1.0)
+            result[label] = {
+                'sales': count,
+                'volume': volume,
+                # Every sale is one NFT, so VWAP reduces to volume / sales
+                'vwap': volume / count if count else None,
+                'median_by_tier': medians,
+                'listings': n_listings,
+                'listings_per_sale': n_listings / count if count else None,
+                'floor': floor_now,
+                'floor_low': float(floor_window['price'].min()) if floor_window.size else None,
+                'floor_high': float(floor_window['price'].max()) if floor_window.size else None,
+                'floor_change': floor_change,
+            }
+        return result
+
+
+class MarketAnalytics:
+    """One ``MarketSeries`` per tracked collection."""
+
+    def __init__(self, slugs, data_dir=DATA_DIR, **capacity):
+        self.series = {
+            slug: MarketSeries(slug, os.path.join(data_dir, f"market-{slug}.npz"), **capacity) for slug in slugs
+        }
+
+    def get(self, slug):
+        return self.series.get(slug)
+
+    def load(self):
+        for series in self.series.values():
+            series.load()
+
+    def flush(self):
+        return sum(series.flush() for series in self.series.values())
+
+
+def _fmt_sol(value):
+    return f"{value:,.2f} SOL" if value is not None else "N/A"
+
+
+def summary_lines(window):
+    """Text block for one window of ``MarketSeries.summary``."""
+    lines = [
+        f"Sales: **{window['sales']}**",
+        f"Volume: **{_fmt_sol(window['volume'])}**",
+        f"VWAP: **{_fmt_sol(window['vwap'])}**",
+        f"Listings: **{window['listings']}**",
+    ]
+    ratio = window['listings_per_sale']
+    lines.append(f"Listings/sale: **{ratio:.2f}**" if ratio is not None else "Listings/sale: **N/A**")
+    if window['floor_change'] is not None:
+        lines.append(f"Floor: **{window['floor_change'] * 100:+.1f}%** "
+                     f"({window['floor_low']:.2f}–{window['floor_high']:.2f})")
+    return "\n".join(lines)
+
+
+def bench(rows=200_000, seed=3):
+    rng = np.random.default_rng(seed)
+    series = MarketSeries('bench', path=os.devnull, event_capacity=rows, floor_capacity=rows // 4)
+    now = time.time()
+    for ring, n in ((series.sales, rows), (series.listings, rows), (series.floors, rows // 4)):
+        data = np.zeros(n, dtype=ring.data.dtype)
+        data['ts'] = np.sort(now - rng.uniform(0, 10 * 86400, n))
+        data['price'] = rng.lognormal(0.5, 0.6, n)
+        if 'tier' in data.dtype.names:
+            data['tier'] = rng.integers(0, len(TIERS), n)
+        ring.append(data)
+    start = time.perf_counter()
+    runs = 20
+    for _ in range(runs):
+        series.summary(now)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Market analytics tools.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    show = sub.add_parser('show', help="print the saved aggregates for a collection")
+    show.add_argument('slug')
+    b = sub.add_parser('bench', help="time one summary over full buffers")
+    b.add_argument('--rows', type=int, nargs='+', default=[10_000, 200_000, 1_000_000])
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        series = MarketSeries(args.slug)
+        if not series.load():
+            print(f"No saved analytics at {series.path}")
+            return 1
+        for label, window in series.summary().items():
+            print(f"[{label}]")
+            print(summary_lines(window).replace('**', ''))
+            for tier, median in window['median_by_tier'].items():
+                print(f"  median {tier}: {median:.3f} SOL")
+    elif args.command == 'bench':
+        for rows in args.rows:
+            print(f"{rows:>9} rows per series: summary of 3 windows in {bench(rows):.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
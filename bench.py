@@ -0,0 +1,215 @@
+"""End-to-end benchmark of one collection tick against local stand-ins.
+
+Runs ``CollectionTracker.poll`` with the real client, caches, journal and
+dispatcher, but against ``fake_magiceden.FakeMagicEden`` and recording
+``FakeChannel`` sinks instead of the live API and Discord. For each burst size
+it reports tick duration (ingest + queue + delivery), events per second,
+HTTP calls per event and peak RSS::
+
+    python bench.py [--bursts 10 100 1000] [--latency-ms 40] [--send-latency-ms 80] [--channels 2]
+
+``--stream`` instead measures alert latency in push mode. Events go out as
+log notifications from ``fake_magiceden.FakeSolanaRpc`` through
+``solana_stream.LogStream``, and each is timed from its notification until
+the fake Discord channel has it::
+
+    python bench.py --stream [--events 200] [--rate 20]
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from dispatch import AlertDispatcher
+from fake_magiceden import FakeChannel, FakeMagicEden, FakeSolanaRpc
+from governor import RequestGovernor
+from journal import EventJournal
+from me_client import MagicEdenClient
+from metadata_cache import TokenMetadataCache
+from solana_stream import LogStream
+from stats_cache import StatsCache
+from tracker import CollectionConfig, CollectionTracker
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+@contextlib.contextmanager
+def _quiet_logs():
+    # Only warnings and errors from the bot's loggers while a burst runs
+    logger = logging.getLogger('koru')
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+
+async def run_burst(burst, args, view_factory):
+    fake = FakeMagicEden(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    base_url = await fake.start()
+    client = MagicEdenClient(base_url, governor=RequestGovernor(rate=args.me_rps, burst=args.me_rps))
+    await client.start()
+    with tempfile.TemporaryDirectory() as data_dir:
+        token_meta = TokenMetadataCache(os.path.join(data_dir, 'meta.sqlite3'))
+        journal = EventJournal(os.path.join(data_dir, 'journal.sqlite3'))
+        token_meta.open()
+        journal.open()
+        channels = {cid: FakeChannel(cid, latency_ms=args.send_latency_ms) for cid in range(1, args.channels + 1)}
+        dispatcher = AlertDispatcher(view_factory)
+        config = CollectionConfig(
+            slug=fake.symbol, name='Koru', channel_ids=list(channels), role_ids={},
+            rarity_file=os.path.join(HERE, 'rarity-ranking.json'),
+        )
+        tracker = CollectionTracker(
+            config, client, StatsCache(client), token_meta, journal, dispatcher, channels.get,
+            page_size=args.page_size, max_pages=math.ceil(burst / args.page_size) + 1,
+        )
+        try:
+            with _quiet_logs() if args.quiet else contextlib.nullcontext():
+                # First tick seeds the journal with the existing history
+                fake.burst(20, with_metadata=args.with_metadata)
+                await tracker.poll()
+                fake.burst(burst, with_metadata=args.with_metadata)
+                fake.calls.clear()
+                start = time.perf_counter()
+                found = await tracker.poll()
+                queued = time.perf_counter()
+                await dispatcher.join()
+                delivered = time.perf_counter()
+        finally:
+            await dispatcher.close()
+            await client.close()
+            await fake.stop()
+            token_meta.close()
+            journal.close()
+    http_calls = sum(fake.calls.values())
+    received = sum(ch.alerts_received for ch in channels.values())
+    return {
+        'burst': burst,
+        'found': found,
+        'ingest_ms': (queued - start) * 1000,
+        'tick_ms': (delivered - start) * 1000,
+        'events_per_s': found / (delivered - start) if found else 0.0,
+        'http_per_event': http_calls / found if found else float('nan'),
+        'calls': dict(fake.calls),
+        'messages': sum(len(ch.sent) for ch in channels.values()),
+        'alerts_delivered': received,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+async def run_stream(args, view_factory):
+    fake = FakeMagicEden(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    rpc = FakeSolanaRpc(fake, latency_ms=args.rpc_latency_ms)
+    client = MagicEdenClient(await fake.start(), governor=RequestGovernor(rate=args.me_rps, burst=args.me_rps))
+    await client.start()
+    await rpc.start()
+    gaps = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        token_meta = TokenMetadataCache(os.path.join(data_dir, 'meta.sqlite3'))
+        journal = EventJournal(os.path.join(data_dir, 'journal.sqlite3'))
+        token_meta.open()
+        journal.open()
+        channel = FakeChannel(1, latency_ms=args.send_latency_ms)
+        dispatcher = AlertDispatcher(view_factory)
+        config = CollectionConfig(
+            slug=fake.symbol, name='Koru', channel_ids=[channel.id], role_ids={},
+            rarity_file=os.path.join(HERE, 'rarity-ranking.json'),
+        )
+        tracker = CollectionTracker(config, client, StatsCache(client), token_meta, journal, dispatcher,
+                                    {channel.id: channel}.get)
+        stream = LogStream(rpc.ws_url, rpc.http_url, dict.fromkeys(fake.mints, fake.symbol),
+                           lambda slug, items: tracker.push(items), gaps.append, rpc_rate=args.rpc_rps)
+        emitted = []
+        try:
+            with _quiet_logs() if args.quiet else contextlib.nullcontext():
+                fake.burst(20, with_metadata=args.with_metadata)
+                await tracker.poll()
+                stream.start()
+                while not stream.connected:
+                    await asyncio.sleep(0.01)
+                for _ in range(args.events):
+                    emitted.append(time.monotonic())
+                    fake.burst(1, with_metadata=args.with_metadata)
+                    await asyncio.sleep(1 / args.rate)
+                deadline = time.monotonic() + 30
+                while channel.alerts_received < args.events and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                await dispatcher.join()
+        finally:
+            await stream.close()
+            await dispatcher.close()
+            await client.close()
+            await rpc.stop()
+            await fake.stop()
+            token_meta.close()
+            journal.close()
+    # One channel delivers in order, so the n-th embed belongs to the n-th event
+    latencies = []
+    for message in channel.sent:
+        for _ in message.get('embeds') or [message.get('embed')]:
+            latencies.append(message['sent_at'] - emitted[len(latencies)])
+    latencies.sort()
+    return {
+        'events': args.events,
+        'delivered': len(latencies),
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else float('nan'),
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else float('nan'),
+        'max_ms': latencies[-1] * 1000 if latencies else float('nan'),
+        'gaps': gaps,
+        'rpc_calls': dict(rpc.calls),
+        'me_calls': dict(fake.calls),
+    }
+
+
+async def main(args):
+    from bot import MEView  # the same view the bot attaches to alerts; importing it configures logging
+
+    if args.stream:
+        r = await run_stream(args, MEView)
+        print(f"{r['delivered']}/{r['events']} alerts at {args.rate:g}/s: latency p50 {r['p50_ms']:.0f} ms, "
+              f"p95 {r['p95_ms']:.0f} ms, max {r['max_ms']:.0f} ms")
+        if args.verbose:
+            print(f"       gaps: {r['gaps']} rpc calls: {r['rpc_calls']} me calls: {r['me_calls']}")
+        return
+    print(f"{'burst':>6} {'found':>6} {'ingest ms':>10} {'tick ms':>9} {'events/s':>9} "
+          f"{'http/event':>10} {'messages':>9} {'peak RSS MB':>12}")
+    for burst in args.bursts:
+        r = await run_burst(burst, args, MEView)
+        print(f"{r['burst']:>6} {r['found']:>6} {r['ingest_ms']:>10.1f} {r['tick_ms']:>9.1f} "
+              f"{r['events_per_s']:>9.1f} {r['http_per_event']:>10.3f} {r['messages']:>9} {r['peak_rss_mb']:>12.1f}")
+        if args.verbose:
+            print(f"       calls: {r['calls']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark one tick against local stand-ins.")
+    parser.add_argument('--bursts', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--latency-ms', type=float, default=40.0, help="fake Magic Eden latency per request")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--me-rps', type=float, default=1000.0, help="Magic Eden request budget per second")
+    parser.add_argument('--send-latency-ms', type=float, default=80.0, help="fake Discord latency per message")
+    parser.add_argument('--channels', type=int, default=2)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--with-metadata', action='store_true', help="activities already carry name/image")
+    parser.add_argument('--stream', action='store_true', help="measure push-mode alert latency instead")
+    parser.add_argument('--events', type=int, default=200, help="events pushed in --stream mode")
+    parser.add_argument('--rate', type=float, default=20.0, help="events per second in --stream mode")
+    parser.add_argument('--rpc-latency-ms', type=float, default=20.0, help="fake Solana RPC latency per request")
+    parser.add_argument('--rpc-rps', type=float, default=100.0, help="getTransaction budget per second")
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--no-quiet', dest='quiet', action='store_false', help="keep the bot's log output")
+    asyncio.run(main(parser.parse_args()))
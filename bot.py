@@ -3,22 +3,127 @@ import os
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands
+from discord.ui import Button, View
 from dotenv import load_dotenv
 
-import aiohttp
 import asyncio
-import json
-from typing import Literal
+import logging
+import time
+from typing import Literal, Optional
+
+from me_client import MagicEdenClient, MagicEdenError
+from analytics import WINDOWS, MarketAnalytics, summary_lines
+from dispatch import AlertDispatcher, count_discord_rate_limits
+from holders import HolderSnapshot, changes_embed
+from journal import EventJournal
+from logs import configure_logging
+from metadata_cache import TokenMetadataCache
+from metrics import start_metrics_server
+from moderation import ModerationQueue
+from ratelimit import PRIORITY_MODERATION, TokenBucket
+from scheduler import AdaptiveInterval
+from solana_stream import LogStream, http_url, load_mint_index
+from stats_cache import StatsCache, floor_sol_from_stats
+from subscriptions import DELIVERY_THREAD, SubscriptionStore, describe as describe_subscription
+from tracker import (
+    CollectionConfig, CollectionTracker, TrackerPool, load_collection_configs, shard_of, tier_emojis,
+)
 
 load_dotenv()
+# LOG_LEVEL / LOG_FORMAT (text or json); 429s from discord.http feed the metrics
+configure_logging()
+count_discord_rate_limits()
+log = logging.getLogger('koru.bot')
 TOKEN = os.getenv('DISCORD_TOKEN')
 # List of Discord channel IDs to send messages to
 CHANNEL_IDS = [1393739742234939422, 1394185183959191572]  # Add more channel IDs as needed
 COLLECTION_ADDRESS = 'koru'
+# Optional multi-collection config; without it only COLLECTION_ADDRESS is tracked
+COLLECTIONS_FILE = os.getenv('COLLECTIONS_FILE', os.path.join(os.path.dirname(__file__), 'collections.json'))
+# Split collections across bot processes by hashing their slug
+SHARD_ID = int(os.getenv('SHARD_ID', '0'))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+# Every shard receives every message and interaction on the shared token. Moderation
+# and general commands run on shard 0; collection commands on the shard owning the slug
+PRIMARY_SHARD = SHARD_ID == 0
+
+
+def owns(slug):
+    """Whether this process answers for ``slug``; other shards stay silent."""
+    return shard_of(slug, SHARD_COUNT) == SHARD_ID
+
+
+# How many collections may be polling at the same time
+MAX_CONCURRENT_POLLS = int(os.getenv('MAX_CONCURRENT_POLLS', '4'))
+
+# Shared, pooled Magic Eden client; opened in setup_hook and closed with the bot
+me_client = MagicEdenClient()
+# Collection stats (floor price) are cached and shared by every caller
+STATS_TTL_SECONDS = float(os.getenv('STATS_TTL_SECONDS', '30'))
+stats_cache = StatsCache(me_client, ttl=STATS_TTL_SECONDS)
+# mint -> name/image/number, persisted across restarts
+token_meta = TokenMetadataCache()
+# Every announced event, persisted so restarts and redeploys do not re-announce
+event_journal = EventJournal(
+    window_size=int(os.getenv('JOURNAL_WINDOW_SIZE', '5000')),
+    max_rows=int(os.getenv('JOURNAL_MAX_ROWS', '100000')),
+    max_age_days=float(os.getenv('JOURNAL_MAX_AGE_DAYS', '30')),
+)
+# Top holders are refreshed in the background; /topholders answers from the snapshot
+HOLDER_REFRESH_SECONDS = float(os.getenv('HOLDER_REFRESH_SECONDS', '600'))
+# Announce holders whose position moved by at least this many NFTs (0 disables)
+HOLDER_ALERT_MIN_DELTA = int(os.getenv('HOLDER_ALERT_MIN_DELTA', '5'))
+# Our own share of Discord's global request limit (50/s per bot); moderation
+# may not use the last DISCORD_ALERT_RESERVE tokens, so alerts always get through
+discord_budget = TokenBucket(
+    rate=float(os.getenv('DISCORD_REQUESTS_PER_SECOND', '40')),
+    reserve=float(os.getenv('DISCORD_ALERT_RESERVE', '10')),
+)
+# Deletes of non-allowed messages are batched per channel (bulk delete, 100 per call)
+moderation = ModerationQueue(discord_budget, event_journal)
+PURGE_PROGRESS_SECONDS = 5.0
+# Per-user alert filters (/alert), matched against every new listing and buy
+subscription_store = SubscriptionStore(max_per_user=int(os.getenv('ALERTS_PER_USER', '25')))
+holder_snapshot = HolderSnapshot(me_client, COLLECTION_ADDRESS, name="Koru", min_delta=HOLDER_ALERT_MIN_DELTA)
+
+
+class KoruBot(commands.Bot):
+    metrics_runner = None
+
+    async def setup_hook(self):
+        token_meta.open()
+        event_journal.open()
+        subscription_store.open()
+        for tracker in tracker_pool.trackers.values():
+            tracker.restore()
+        holder_snapshot.load()
+        market.load()
+        await me_client.start()
+        if os.getenv('METRICS_DISABLED') != '1':
+            try:
+                self.metrics_runner = await start_metrics_server()
+            except OSError as e:
+                log.error("could not start metrics server", extra={'error': str(e)})
+
+    async def close(self):
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        if log_stream is not None:
+            await log_stream.close()
+        await tracker_pool.close()
+        await moderation.close()
+        await dispatcher.close()
+        await me_client.close()
+        market.flush()
+        token_meta.close()
+        event_journal.close()
+        subscription_store.close()
+        await super().close()
+
 
 intents = discord.Intents.default()
 intents.message_content = True  # Enable message content intent for commands
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = KoruBot(command_prefix='!', intents=intents)
 
 ALLOWED_USER_IDS = {908499792043335680}  # Replace with actual allowed user IDs (as integers)
 
@@ -42,40 +147,103 @@ async def on_message(message):
     if message.author == bot.user or message.author.id in ALLOWED_USER_IDS:
         await bot.process_commands(message)
         return
-    # Delete all other user messages in the channel
-    try:
-        await message.delete()
-    except Exception as e:
-        print(f"[ERROR] Could not delete message from {message.author}: {e}")
+    # Delete all other user messages in the channel (queued and bulk-deleted), once across shards
+    if PRIMARY_SHARD:
+        moderation.submit(message)
 
 # Sync tree for slash commands
 @bot.event
 async def on_ready():
-    print(f'Logged in as {bot.user.name}')
+    log.info("logged in", extra={'user': bot.user.name})
     # Set bot status and activity
     activity = discord.Activity(type=discord.ActivityType.watching, name="for wild Koru")
     await bot.change_presence(status=discord.Status.online, activity=activity)
     try:
         synced = await bot.tree.sync()
-        print(f"[LOG] Synced {len(synced)} slash commands.")
+        log.info("synced slash commands", extra={'count': len(synced)})
     except Exception as e:
-        print(f"[ERROR] Syncing slash commands: {e}")
-    track_nft_events.start()
+        log.error("syncing slash commands failed", extra={'error': str(e)})
+    if not track_nft_events.is_running():
+        track_nft_events.start()
+    if not prune_journal.is_running():
+        prune_journal.start()
+    if not refresh_holders.is_running():
+        refresh_holders.start()
+    if not record_market.is_running():
+        record_market.start()
+    if log_stream is not None and not log_stream.running:
+        log_stream.start()
 
 
 @bot.command()
 @commands.has_permissions(manage_messages=True)
-async def clean(ctx):
-    """Delete all messages in the current channel."""
-    await ctx.send("Cleaning up messages...", delete_after=2)
+async def clean(ctx, action: str = 'start'):
+    """Delete all unpinned messages in the current channel.
+
+    ``!clean`` resumes an interrupted purge if there is one, ``!clean restart``
+    starts over from the newest message, ``!clean stop`` pauses it.
+    """
+    if not PRIMARY_SHARD:
+        return
+    channel_id = ctx.channel.id
+    if action == 'stop':
+        stopped = moderation.cancel_purge(channel_id)
+        await ctx.send("Purge paused; `!clean` resumes it." if stopped else "No purge is running.", delete_after=5)
+        return
+    if moderation.purging(channel_id):
+        await ctx.send("A purge is already running here; `!clean stop` pauses it.", delete_after=5)
+        return
+    resume = action != 'restart'
+    saved = moderation.saved_purge(channel_id) if resume else None
+    status = await ctx.send("Resuming cleanup..." if saved else "Cleaning up messages...")
+    last_edit = 0.0
+
+    async def report(state):
+        nonlocal last_edit
+        now = asyncio.get_running_loop().time()
+        # Progress edits share the moderation budget; a few seconds apart is plenty
+        if not state['done'] and now - last_edit < PURGE_PROGRESS_SECONDS:
+            return
+        last_edit = now
+        text = f"Deleted {state['deleted']} of {state['scanned']} messages scanned"
+        text += "." if state['done'] else "..."
+        await discord_budget.acquire(priority=PRIORITY_MODERATION)
+        try:
+            await status.edit(content=text)
+        except discord.HTTPException:
+            pass
+
     def not_pinned(msg):
-        return not msg.pinned
-    deleted = await ctx.channel.purge(limit=None, check=not_pinned)
-    await ctx.send(f"Deleted {len(deleted)} messages.", delete_after=5)
+        return not msg.pinned and msg.id != status.id
+    task = moderation.purge(ctx.channel, check=not_pinned, progress=report, resume=resume)
+    # wait() rather than await so a paused (cancelled) purge does not cancel this command
+    await asyncio.wait([task])
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        await status.edit(content=f"Cleanup stopped: {task.exception()}. `!clean` resumes it.")
+        return
+    await status.delete(delay=5)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def warmmeta(ctx):
+    """Preload token metadata for every currently listed NFT."""
+    if not owns(COLLECTION_ADDRESS):
+        return
+    await ctx.send("Warming metadata cache...", delete_after=2)
+    try:
+        stored = await token_meta.warm_from_listings(me_client, COLLECTION_ADDRESS)
+    except Exception as e:
+        await ctx.send(f"Metadata warm-up failed: {e}", delete_after=10)
+        return
+    await ctx.send(f"Cached metadata for {stored} tokens ({len(token_meta)} total).", delete_after=10)
 
 @bot.tree.command(name="sub", description="Subscribe to rarity alerts")
 @app_commands.describe(tier="Choose a rarity tier to subscribe to")
 async def sub(interaction: discord.Interaction, tier: Literal["mythic", "legendary", "epic", "rare"]):
+    if not PRIMARY_SHARD:
+        return
     guild = interaction.guild
     role_name = TIER_ROLES[tier]
     role = discord.utils.get(guild.roles, name=role_name)
@@ -100,6 +268,8 @@ async def sub(interaction: discord.Interaction, tier: Literal["mythic", "legenda
 @bot.tree.command(name="unsub", description="Unsubscribe from rarity alerts")
 @app_commands.describe(tier="Choose a rarity tier to unsubscribe from")
 async def unsub(interaction: discord.Interaction, tier: Literal["mythic", "legendary", "epic", "rare"]):
+    if not PRIMARY_SHARD:
+        return
     guild = interaction.guild
     role_name = TIER_ROLES[tier]
     role = discord.utils.get(guild.roles, name=role_name)
@@ -121,338 +291,364 @@ async def unsub(interaction: discord.Interaction, tier: Literal["mythic", "legen
         await interaction.response.send_message(f"Error removing role: {e}", ephemeral=True)
 
 
-# Load rarity data once at startup
-RARITY_DATA = None
-RARITY_PATH = os.path.join(os.path.dirname(__file__), 'rarity-ranking.json')
-try:
-    with open(RARITY_PATH, 'r', encoding='utf-8') as f:
-        RARITY_DATA = json.load(f)
-except Exception as e:
-    print(f"[ERROR] Could not load rarity-ranking.json: {e}")
+alert_group = app_commands.Group(name="alert", description="Personal alerts for listings and buys")
+
+
+@alert_group.command(name="add", description="Get a DM or thread message when a matching event happens")
+@app_commands.describe(
+    event="Listings, buys or both",
+    tier="Only this rarity tier",
+    rank_min="Lowest (rarest) rank to include",
+    rank_max="Highest rank to include, e.g. 100 for the top 100",
+    price_min="Minimum price in SOL",
+    price_max="Maximum price in SOL",
+    max_floor_pct="Only at or below this % of floor, e.g. 100 = at or below floor",
+    delivery="Send to your DMs or to a private thread here",
+    collection="Collection slug (defaults to Koru)",
+)
+async def alert_add(
+    interaction: discord.Interaction,
+    event: Literal["listings", "buys", "both"] = "listings",
+    tier: Optional[Literal["mythic", "legendary", "epic", "rare", "common"]] = None,
+    rank_min: Optional[app_commands.Range[int, 1]] = None,
+    rank_max: Optional[app_commands.Range[int, 1]] = None,
+    price_min: Optional[app_commands.Range[float, 0.0]] = None,
+    price_max: Optional[app_commands.Range[float, 0.0]] = None,
+    max_floor_pct: Optional[app_commands.Range[int, 1, 1000]] = None,
+    delivery: Literal["dm", "thread"] = "dm",
+    collection: Optional[str] = None,
+):
+    collection = (collection or COLLECTION_ADDRESS).lower()
+    if not owns(collection):
+        return  # the shard tracking the collection stores and matches its alerts
+    if collection not in {config.slug for config in ALL_COLLECTIONS}:
+        await interaction.response.send_message(f"❌ Unknown collection **{collection}**.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    thread_id = None
+    if delivery == DELIVERY_THREAD:
+        thread_id = await _alert_thread_for(interaction)
+        if thread_id is None:
+            await interaction.followup.send("❌ Could not create a thread here; try `delivery: dm`.", ephemeral=True)
+            return
+    try:
+        sub = subscription_store.add(
+            interaction.user.id, collection,
+            event_type={"listings": 'list', "buys": 'buyNow', "both": None}[event],
+            tier=tier.title() if tier else None,
+            rank_min=rank_min, rank_max=rank_max, price_min=price_min, price_max=price_max,
+            max_floor_ratio=max_floor_pct / 100 if max_floor_pct else None,
+            delivery=delivery, thread_id=thread_id,
+        )
+    except ValueError as e:
+        await interaction.followup.send(f"❌ {e}", ephemeral=True)
+        return
+    await interaction.followup.send(f"✅ Alert added: {describe_subscription(sub)}", ephemeral=True)
+
 
+async def _alert_thread_for(interaction):
+    """Reuse the user's existing alert thread, or open a private one in this channel."""
+    if isinstance(interaction.channel, discord.Thread):
+        return interaction.channel.id
+    for existing in subscription_store.for_user(interaction.user.id):
+        if existing.thread_id and await alert_thread(existing.thread_id) is not None:
+            return existing.thread_id
+    try:
+        thread = await interaction.channel.create_thread(
+            name=f"{interaction.user.display_name} alerts"[:100],
+            type=discord.ChannelType.private_thread,
+            invitable=False,
+        )
+        await thread.add_user(interaction.user)
+    except (discord.HTTPException, AttributeError) as e:
+        log.error("could not create alert thread", extra={'user': interaction.user.id, 'error': str(e)})
+        return None
+    return thread.id
+
+
+@alert_group.command(name="list", description="Show your personal alerts")
+@app_commands.describe(collection="Collection slug (defaults to Koru)")
+async def alert_list(interaction: discord.Interaction, collection: Optional[str] = None):
+    collection = (collection or COLLECTION_ADDRESS).lower()
+    if not owns(collection):
+        return
+    subs = [sub for sub in subscription_store.for_user(interaction.user.id) if sub.collection == collection]
+    if not subs:
+        await interaction.response.send_message("You have no alerts. Add one with `/alert add`.", ephemeral=True)
+        return
+    await interaction.response.send_message("\n".join(describe_subscription(sub) for sub in subs), ephemeral=True)
 
-# Tier emojis for rarity
-tier_emojis = {
-    "Mythic": "🟣",
-    "Legendary": "🟡",
-    "Epic": "🟢",
-    "Rare": "🔵",
-    "Common": "⚪"
-}
 
-# Rarity color hex codes for embeds
-rarity_colors = {
-    "Mythic": "#a98dd6",     # 🟣
-    "Legendary": "#FFD700",  # 🟡
-    "Epic": "#77b058",       # 🟢
-    "Rare": "#55abed",       # 🔵
-    "Common": "#FFFFFF"      # ⚪
-}
+@alert_group.command(name="remove", description="Remove one of your personal alerts")
+@app_commands.describe(alert_id="The number shown by /alert list", collection="Collection slug (defaults to Koru)")
+async def alert_remove(interaction: discord.Interaction, alert_id: int, collection: Optional[str] = None):
+    if not owns((collection or COLLECTION_ADDRESS).lower()):
+        return
+    if subscription_store.remove(interaction.user.id, alert_id):
+        await interaction.response.send_message(f"✅ Removed alert `#{alert_id}`.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"❌ You have no alert `#{alert_id}`.", ephemeral=True)
 
-def get_rarity_color(rarity):
-    return int(rarity_colors.get(rarity, "#2ecc71").lstrip('#'), 16)
 
-last_listing_ids = set()
-last_buy_ids = set()
+bot.tree.add_command(alert_group)
+
+
+@bot.tree.command(name="stats", description="Volume, prices and floor history over 1h, 24h and 7d.")
+@app_commands.describe(collection="Collection slug (defaults to Koru)")
+async def stats(interaction: discord.Interaction, collection: Optional[str] = None):
+    """Answer from the in-memory analytics store; never calls the API."""
+    slug = (collection or COLLECTION_ADDRESS).lower()
+    if not owns(slug):
+        return  # answered by the shard that records this collection
+    series = market.get(slug)
+    if series is None:
+        await interaction.response.send_message(f"❌ **{slug}** is not tracked here.", ephemeral=True)
+        return
+    summary = series.cached_summary()
+    name = next((config.name for config in COLLECTIONS if config.slug == slug), slug.title())
+    floor = summary[WINDOWS[0][0]]['floor']
+    embed = discord.Embed(
+        title=f"📊 {name} market stats",
+        description=f"Floor: **{floor:.3f} SOL**" if floor is not None else "Floor: N/A",
+        color=0x3498db
+    )
+    for label, _ in WINDOWS:
+        embed.add_field(name=label, value=summary_lines(summary[label]), inline=True)
+    tiers = [tier for tier in tier_emojis if any(tier in summary[label]['median_by_tier'] for label, _ in WINDOWS)]
+    if tiers:
+        lines = []
+        for tier in tiers:
+            medians = [summary[label]['median_by_tier'].get(tier) for label, _ in WINDOWS]
+            cells = " | ".join(f"{m:.2f}" if m is not None else "–" for m in medians)
+            lines.append(f"{tier_emojis[tier]} {tier}: {cells}")
+        embed.add_field(
+            name=f"Median sale (SOL): {' | '.join(label for label, _ in WINDOWS)}",
+            value="\n".join(lines),
+            inline=False
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+class MEView(View):
+    """Magic Eden link(s) plus a disabled button showing the cached floor price.
+
+    Built for one outgoing message; when several alerts are packed into it,
+    each gets its own link button labelled with the NFT name.
+    """
+
+    def __init__(self, alerts):
+        super().__init__()
+        if len(alerts) == 1:
+            self.add_item(Button(label="Magic Eden", url=f"https://magiceden.io/item-details/{alerts[0].mint}"))
+        else:
+            for alert in alerts:
+                self.add_item(Button(label=alert.label[:80], url=f"https://magiceden.io/item-details/{alert.mint}"))
+        floor_sol = alerts[-1].floor_sol
+        if floor_sol is not None:
+            self.add_item(Button(label=f"Floor: {floor_sol:.3f} SOL", disabled=True))
+        else:
+            self.add_item(Button(label="Floor: N/A", disabled=True))
+
+
+# Per-channel send queues; alerts for all channels go out concurrently
+dispatcher = AlertDispatcher(MEView, budget=discord_budget)
+
+
+def make_poll_schedule():
+    """Activity poll interval, adapted to how busy a collection is."""
+    return AdaptiveInterval(
+        min_seconds=float(os.getenv('POLL_MIN_SECONDS', '15')),
+        max_seconds=float(os.getenv('POLL_MAX_SECONDS', '300')),
+        initial_seconds=float(os.getenv('POLL_INITIAL_SECONDS', '120')),
+    )
+
+
+_dm_channels = {}  # user id -> DMChannel
+_alert_threads = {}  # thread id -> Thread fetched after discord.py dropped it from its cache
+_floor_recorded = {}  # slug -> fetch time of the stats behind the last floor reading
+
+
+async def alert_thread(thread_id):
+    """The alert thread ``thread_id``, or None if it is gone or unreachable right now.
+
+    discord.py evicts archived threads from its cache (private threads archive
+    after a day without messages), and nothing is cached after a restart, so
+    the thread is fetched then. Sending to it unarchives it. Subscriptions to
+    a deleted thread are removed.
+    """
+    thread = bot.get_channel(thread_id) or _alert_threads.get(thread_id)
+    if thread is not None:
+        return thread
+    try:
+        await discord_budget.acquire()
+        thread = await bot.fetch_channel(thread_id)
+    except discord.NotFound:
+        removed = subscription_store.remove_thread(thread_id)
+        log.warning("alert thread is gone; removed its alerts", extra={'thread': thread_id, 'removed': removed})
+        return None
+    except discord.HTTPException as e:
+        log.error("could not fetch alert thread", extra={'thread': thread_id, 'error': str(e)})
+        return None
+    _alert_threads[thread_id] = thread
+    return thread
+
+
+async def subscription_target(sub):
+    """Where a matched subscription is delivered: the user's DM channel or their thread."""
+    if sub.delivery == DELIVERY_THREAD:
+        return await alert_thread(sub.thread_id)
+    channel = _dm_channels.get(sub.user_id)
+    if channel is None:
+        try:
+            user = bot.get_user(sub.user_id)
+            if user is None:
+                await discord_budget.acquire()
+                user = await bot.fetch_user(sub.user_id)
+            channel = user.dm_channel
+            if channel is None:
+                await discord_budget.acquire()
+                channel = await user.create_dm()
+        except discord.HTTPException as e:
+            log.error("could not open DM for alert", extra={'user': sub.user_id, 'error': str(e)})
+            return None
+        _dm_channels[sub.user_id] = channel
+    return channel
+
+
+DEFAULT_COLLECTION = CollectionConfig(
+    slug=COLLECTION_ADDRESS,
+    name="Koru",
+    channel_ids=CHANNEL_IDS,
+    role_ids=RARITY_ROLE_IDS,
+    rarity_file=os.path.join(os.path.dirname(__file__), 'rarity-ranking.json'),
+    hashlist_file=os.getenv('HASHLIST_FILE', os.path.join(os.path.dirname(__file__), 'hashlist.json')),
+)
+ALL_COLLECTIONS = load_collection_configs(COLLECTIONS_FILE, DEFAULT_COLLECTION)
+COLLECTIONS = [config for config in ALL_COLLECTIONS if owns(config.slug)]
+# Sales, listings and floor history for /stats, kept in ring buffers and saved to data/
+market = MarketAnalytics([config.slug for config in COLLECTIONS])
+MARKET_FLUSH_EVERY = 5  # floor readings (minutes) between saves
+# One tracker per collection in this shard, each with its own ingestion state and schedule
+tracker_pool = TrackerPool(
+    [
+        CollectionTracker(
+            config, me_client, stats_cache, token_meta, event_journal, dispatcher, bot.get_channel,
+            page_size=int(os.getenv('ACTIVITY_PAGE_SIZE', '100')),
+            max_pages=int(os.getenv('ACTIVITY_MAX_PAGES', '5')),
+            schedule=make_poll_schedule(),
+            subscriptions=subscription_store,
+            get_target=subscription_target,
+            market=market.get(config.slug),
+        )
+        for config in COLLECTIONS
+    ],
+    max_concurrent=MAX_CONCURRENT_POLLS,
+)
+# Optional push mode: marketplace program logs over a Solana RPC websocket, with
+# REST polling as the safety net that catches up whenever the stream may have missed events
+SOLANA_WS_URL = os.getenv('SOLANA_WS_URL')
+log_stream = None
+if SOLANA_WS_URL:
+    _mint_index = load_mint_index(COLLECTIONS)
+    if _mint_index:
+        log_stream = LogStream(
+            SOLANA_WS_URL, os.getenv('SOLANA_RPC_URL') or http_url(SOLANA_WS_URL), _mint_index,
+            tracker_pool.push, lambda reason: tracker_pool.catch_up(),
+            rpc_rate=float(os.getenv('SOLANA_RPC_REQUESTS_PER_SECOND', '25')),
+        )
+        tracker_pool.stream = log_stream
+    else:
+        log.warning("SOLANA_WS_URL is set but no collection has a hashlist; using REST polling only")
 
 
 @bot.tree.command(name="topholders", description="Show the top Koru NFT holders.")
 async def toppholders(interaction: discord.Interaction):
-    """Fetch and display the top Koru NFT holders in an embed."""
-    await interaction.response.defer(thinking=True)
-    url = "https://api-mainnet.magiceden.dev/v2/collections/koru/holder_stats"
-    headers = {"accept": "application/json"}
+    """Show the top Koru NFT holders from the background-refreshed snapshot."""
+    if not owns(COLLECTION_ADDRESS):
+        return
+    if holder_snapshot.embed is not None:
+        await interaction.response.send_message(embed=holder_snapshot.embed, ephemeral=True)
+        return
+    # Nothing cached yet (first start): wait for the shared refresh instead of starting another
+    await interaction.response.defer(thinking=True, ephemeral=True)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as resp:
-                if resp.status != 200:
-                    await interaction.followup.send(f"Failed to fetch holder stats: {resp.status}")
-                    return
-                data = await resp.json()
-        holders = data.get('topHolders', [])
-        if not holders:
-            await interaction.followup.send("No holder data found.")
-            return
-        top = holders[:25]
-        embed = discord.Embed(
-            title="Top Koru NFT Holders",
-            description="Here are the top 25 holders by number of NFTs held.",
-            color=0x3498db
-        )
-        for idx, holder in enumerate(top, 1):
-            addr = holder.get('owner', 'Unknown')
-            count = holder.get('tokens', 0)
-            solscan = f'https://solscan.io/account/{addr}'
-            # Prefer sol domain if available
-            sol_domain = None
-            owner_display = holder.get('ownerDisplay', {})
-            if isinstance(owner_display, dict):
-                sol_domain = owner_display.get('sol')
-            display_name = sol_domain if sol_domain else f"{addr[:4]}...{addr[-4:]}"
-            embed.add_field(
-                name=f"#{idx}: {display_name}",
-                value=f"NFTs: **{count}** | [Solscan]({solscan})",
-                inline=False
-            )
-        await interaction.followup.send(embed=embed, ephemeral=True)
+        await asyncio.shield(holder_snapshot.refresh())
+    except MagicEdenError as e:
+        await interaction.followup.send(f"Failed to fetch holder stats: {e.status}")
+        return
     except Exception as e:
         await interaction.followup.send(f"Error fetching top holders: {e}")
+        return
+    if holder_snapshot.embed is None:
+        await interaction.followup.send("No holder data found.")
+        return
+    await interaction.followup.send(embed=holder_snapshot.embed, ephemeral=True)
 
-@tasks.loop(minutes=2)
+@tasks.loop(seconds=5)
 async def track_nft_events():
+    """Start polls for every collection whose adaptive interval has elapsed."""
     await bot.wait_until_ready()
-    channels = [bot.get_channel(cid) for cid in CHANNEL_IDS]
-    print(f"[LOG] Checking events for collection {COLLECTION_ADDRESS} in channels {CHANNEL_IDS}")
-    if not any(channels):
-        print(f"[ERROR] None of the channels in {CHANNEL_IDS} were found.")
+    tracker_pool.start_due()
+
+@tasks.loop(seconds=HOLDER_REFRESH_SECONDS)
+async def refresh_holders():
+    # Only the shard that tracks the collection refreshes (and announces), so it is fetched once
+    if not owns(COLLECTION_ADDRESS):
+        return
+    try:
+        changes = await holder_snapshot.refresh()
+    except Exception:
+        return  # logged by the snapshot; keep serving the previous one
+    if not changes or not HOLDER_ALERT_MIN_DELTA:
         return
-    async with aiohttp.ClientSession() as session:
-        # Fetch all activities and filter by type in code
-        activities_url = f"https://api-mainnet.magiceden.dev/v2/collections/{COLLECTION_ADDRESS}/activities?limit=10"
-        print(f"[LOG] Fetching activities from Magic Eden API.")
-        async with session.get(activities_url) as resp:
-            print(f"[LOG] Activities response status: {resp.status}")
-            if resp.status == 200:
-                data = await resp.json()
-                # Only send new listings and buys (not previously sent), in chronological order
-                global last_listing_ids, last_buy_ids
-                new_listings = []
-                new_buys = []
-                # Collect new listings (oldest first)
-                for item in reversed(data):
-                    if item.get('type') == 'list':
-                        listing_id = item.get('tokenMint')
-                        if listing_id and listing_id not in last_listing_ids:
-                            new_listings.append(item)
-                # Collect new buys (oldest first)
-                for item in reversed(data):
-                    if item.get('type') == 'buyNow':
-                        mint = item.get('tokenMint')
-                        if mint and mint not in last_buy_ids:
-                            new_buys.append(item)
-                # Send new listings (oldest first) as embeds with fallbacks
-                for item in new_listings:
-                    mint = item.get('tokenMint', 'Unknown')
-                    price = item.get('price', 'N/A')
-                    lister = item.get('seller', 'Unknown')
-                    lister_link = f'https://solscan.io/account/{lister}' if lister != 'Unknown' else None
-                    # Try to get name and image from activity
-                    name = item.get('name')
-                    image = item.get('image')
-                    # Fallback: fetch metadata if missing
-                    if not name or not image:
-                        try:
-                            async with aiohttp.ClientSession() as meta_session:
-                                meta_url = f"https://api-mainnet.magiceden.dev/v2/tokens/{mint}"
-                                async with meta_session.get(meta_url) as meta_resp:
-                                    if meta_resp.status == 200:
-                                        meta = await meta_resp.json()
-                                        if not name:
-                                            name = meta.get('name', mint)
-                                        if not image:
-                                            image = meta.get('image')
-                        except Exception as e:
-                            print(f"[ERROR] Metadata fetch failed for {mint}: {e}")
-                    if not name:
-                        name = f"NFT {mint[:6]}..."
-
-                    # Extract NFT number from name (e.g., "Koru #1234")
-                    nft_number = None
-                    if name:
-                        import re
-                        match = re.search(r'#(\d+)', name)
-                        if match:
-                            nft_number = match.group(1)
-                    # Lookup rarity info
-                    rarity_str = ''
-                    embed_color = 0x2ecc71  # default green
-                    if nft_number and RARITY_DATA and nft_number in RARITY_DATA:
-                        rarity = RARITY_DATA[nft_number]
-                        tier = rarity.get('tier', 'Unknown')
-                        emoji = tier_emojis.get(tier, '')
-                        rarity_str = f"**Rarity:** {emoji} {tier} | **Rank:** {rarity.get('rank', 'N/A')}"
-                        embed_color = get_rarity_color(tier)
-                    elif nft_number:
-                        rarity_str = "**Rarity:** Unknown | **Rank:** N/A"
-
-                    # Fetch floor price
-                    floor_price = None
-                    try:
-                        stats_url = f"https://api-mainnet.magiceden.dev/v2/collections/{COLLECTION_ADDRESS}/stats"
-                        async with session.get(stats_url) as stats_resp:
-                            if stats_resp.status == 200:
-                                stats_data = await stats_resp.json()
-                                floor_price = stats_data.get('floorPrice')
-                    except Exception as e:
-                        print(f"[ERROR] Could not fetch floor price: {e}")
-                    floor_sol = None
-                    if floor_price:
-                        try:
-                            floor_sol = float(floor_price) / 1_000_000_000
-                        except Exception:
-                            floor_sol = None
-
-                    # Build embed
-                    lister_display = f"[Seller]({lister_link})" if lister_link else '`Unknown`'
-                    desc = f"**Price:** {price} SOL"
-                    if rarity_str:
-                        desc += f"\n{rarity_str}"
-                    # Add rarity role ping if valid tier and role ID
-                    role_mention = None
-                    if 'tier' in locals():
-                        role_id = RARITY_ROLE_IDS.get(tier.lower())
-                        if role_id:
-                            role_mention = f"<@&{role_id}>"
-                            desc += f"\n\n{lister_display}"  # keep lister in embed
-                        else:
-                            desc += f"\n\n{lister_display}"
-                    else:
-                        desc += f"\n\n{lister_display}"
-
-
-                    embed = discord.Embed(
-                        title=f"🔥 New Listing: {name}",
-                        description=desc,
-                        color=embed_color
-                    )
-                    if image:
-                        embed.set_image(url=image)
-
-                    components = None
-                    try:
-                        from discord.ui import Button, View
-                        class MEView(View):
-                            def __init__(self):
-                                super().__init__()
-                                self.add_item(Button(label="Magic Eden", url=f"https://magiceden.io/item-details/{mint}"))
-                                if floor_sol is not None:
-                                    self.add_item(Button(label=f"Floor: {floor_sol:.3f} SOL", disabled=True))
-                                else:
-                                    self.add_item(Button(label="Floor: N/A", disabled=True))
-                        components = MEView()
-                    except Exception:
-                        pass
-                    for channel in channels:
-                        if channel:
-                            if components:
-                                await channel.send(content=role_mention or None, embed=embed, view=components)
-                            else:
-                                await channel.send(content=role_mention or None, embed=embed)
-
-                    print(f"[SENT] Listing: {name} for {price} SOL")
-                    last_listing_ids.add(mint)
-                if not new_listings:
-                    print("[LOG] No new listings found.")
-                    
-                # Send new buys (oldest first) as embeds with fallbacks
-                for item in new_buys:
-                    price = item.get('price', 'N/A')
-                    buyer = item.get('buyer', 'Unknown')
-                    buyer_link = f'https://solscan.io/account/{buyer}' if buyer != 'Unknown' else None
-                    # Use tokenMint for consistency, fallback to mint
-                    mint = item.get('tokenMint') or item.get('mint', '')
-                    # Try to get name and image from activity
-                    name = item.get('name')
-                    image = item.get('image')
-                    # Fallback: fetch metadata if missing
-                    if mint and (not name or not image):
-                        try:
-                            async with aiohttp.ClientSession() as meta_session:
-                                meta_url = f"https://api-mainnet.magiceden.dev/v2/tokens/{mint}"
-                                async with meta_session.get(meta_url) as meta_resp:
-                                    if meta_resp.status == 200:
-                                        meta = await meta_resp.json()
-                                        if not name:
-                                            name = meta.get('name', mint)
-                                        if not image:
-                                            image = meta.get('image')
-                        except Exception as e:
-                            print(f"[ERROR] Metadata fetch failed for {mint}: {e}")
-                    if not name:
-                        name = f"NFT {mint[:6]}..."
-
-                    # Extract NFT number from name (e.g., "Koru #1234")
-                    nft_number = None
-                    if name:
-                        import re
-                        match = re.search(r'#(\d+)', name)
-                        if match:
-                            nft_number = match.group(1)
-                    # Lookup rarity info
-                    rarity_str = ''
-                    embed_color = 0xe67e22  # default orange
-                    if nft_number and RARITY_DATA and nft_number in RARITY_DATA:
-                        rarity = RARITY_DATA[nft_number]
-                        tier = rarity.get('tier', 'Unknown')
-                        emoji = tier_emojis.get(tier, '')
-                        rarity_str = f"**Rarity:** {emoji} {tier} | **Rank:** {rarity.get('rank', 'N/A')}"
-                        embed_color = get_rarity_color(tier)
-                    elif nft_number:
-                        rarity_str = "**Rarity:** Unknown | **Rank:** N/A"
-
-                    # Fetch floor price for buy messages
-                    floor_price = None
-                    try:
-                        stats_url = f"https://api-mainnet.magiceden.dev/v2/collections/{COLLECTION_ADDRESS}/stats"
-                        async with session.get(stats_url) as stats_resp:
-                            if stats_resp.status == 200:
-                                stats_data = await stats_resp.json()
-                                floor_price = stats_data.get('floorPrice')
-                    except Exception as e:
-                        print(f"[ERROR] Could not fetch floor price: {e}")
-                    floor_sol = None
-                    if floor_price:
-                        try:
-                            floor_sol = float(floor_price) / 1_000_000_000
-                        except Exception:
-                            floor_sol = None
-
-                    buyer_display = f"[Buyer]({buyer_link})" if buyer_link else '`Unknown`'
-                    seller = item.get('seller', 'Unknown')
-                    seller_link = f'https://solscan.io/account/{seller}' if seller != 'Unknown' else None
-                    seller_display = f"[Seller]({seller_link})" if seller_link else '`Unknown`'
-                    desc = f"**Sold for:** {price} SOL"
-                    if rarity_str:
-                        desc += f"\n{rarity_str}"
-                    desc += f"\n\n{seller_display} 🤝 {buyer_display}"
-                    embed = discord.Embed(
-                        title=f"🎉 New Buy: {name}",
-                        description=desc,
-                        color=embed_color
-                    )
-                    if image:
-                        embed.set_image(url=image)
-                    components = None
-                    try:
-                        from discord.ui import Button, View
-                        class MEView(View):
-                            def __init__(self):
-                                super().__init__()
-                                self.add_item(Button(label="Magic Eden", url=f"https://magiceden.io/item-details/{mint}"))
-                                if floor_sol is not None:
-                                    self.add_item(Button(label=f"Floor: {floor_sol:.3f} SOL", disabled=True))
-                                else:
-                                    self.add_item(Button(label="Floor: N/A", disabled=True))
-                        components = MEView()
-                    except Exception:
-                        pass
-
-                    for channel in channels:
-                        if channel:
-                            if components:
-                                await channel.send(embed=embed, view=components)
-                            else:
-                                await channel.send(embed=embed)
-                    print(f"[SENT] Buy: {price} SOL by {buyer}")
-                    last_buy_ids.add(mint)
-                if not new_buys:
-                    print("[LOG] No new buys found.")
-            else:
-                print(f"[ERROR] Failed to fetch activities: {resp.status}")
+    log.info("holder moves", extra={'collection': COLLECTION_ADDRESS, 'changes': len(changes)})
+    embed = changes_embed(holder_snapshot.name, changes)
+    for channel_id in CHANNEL_IDS:
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            continue
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            log.error("could not announce holder moves", extra={'channel': channel_id, 'error': str(e)})
+
+@tasks.loop(minutes=1)
+async def record_market():
+    """Record a floor reading per collection (from the stats cache) and save the analytics now and then."""
+    for slug, series in market.series.items():
+        # Whatever the polls last fetched, once per fetch and stamped with when it was fetched,
+        # so a quiet collection's hours-old floor isn't recorded again as a fresh reading
+        fetched_at = stats_cache.fetched_at(slug)
+        if fetched_at is None or fetched_at <= _floor_recorded.get(slug, 0):
+            continue
+        _floor_recorded[slug] = fetched_at
+        series.record_floor(fetched_at, floor_sol_from_stats(stats_cache.peek(slug)))
+    if record_market.current_loop % MARKET_FLUSH_EVERY == 0:
+        try:
+            market.flush()
+        except OSError as e:
+            log.error("could not save market analytics", extra={'error': str(e)})
+
+@tasks.loop(hours=1)
+async def prune_journal():
+    removed = event_journal.prune()
+    if removed:
+        log.info("pruned journal", extra={'removed': removed})
+
+@bot.command()
+async def pollstatus(ctx):
+    """Show each collection's adaptive poll interval and recent hit rate."""
+    lines = [f"**{slug}**: {tracker.schedule.describe()}" for slug, tracker in tracker_pool.trackers.items()]
+    if log_stream is not None:
+        lines.append(f"Log stream: {'live' if log_stream.connected else 'down, polling to catch up'}")
+    await ctx.send("\n".join(lines) or f"No collections assigned to shard {SHARD_ID}/{SHARD_COUNT}.")
 
 @bot.command()
 async def hello(ctx):
+    if not PRIMARY_SHARD:
+        return
     await ctx.send('Hello! I am your NFT tracker bot.')
 
 if __name__ == '__main__':
-    bot.run(TOKEN)
\ No newline at end of file
+    # Logging is configured above; keep discord.py from installing its own handler
+    bot.run(TOKEN, log_handler=None)
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""Concurrent fan-out of alerts to Discord channels.
+
+Every channel gets its own queue and worker task. Discord rate-limits
+``POST /channels/{id}/messages`` per channel, so one worker per channel keeps a
+single request in flight per bucket while different channels send in
+parallel. discord.py already waits out 429s per bucket; the dispatcher counts
+any send that still fails with one. When several alerts are waiting, a
+worker packs up to ``max_embeds`` of them into a single message. A worker
+that stays idle for ``idle_timeout`` seconds exits and drops its queue, so the
+per-user DM and thread targets of subscriptions don't each keep a task. With a
+shared ``budget`` (``ratelimit.TokenBucket``) every send takes a token at
+alert priority, ahead of any moderation waiting on the same bucket.
+"""
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+import discord
+
+from metrics import Counter, Gauge, Histogram
+from ratelimit import PRIORITY_ALERT
+
+log = logging.getLogger('koru.dispatch')
+
+ALERTS_SENT = Counter('koru_alerts_sent_total', "Alerts delivered to Discord", ['channel'])
+SEND_FAILURES = Counter('koru_discord_send_failures_total', "Discord sends that raised", ['channel'])
+DISCORD_429 = Counter('koru_discord_429_total', "429 responses from Discord (retried by discord.py or not)")
+SEND_LATENCY = Histogram('koru_discord_send_seconds', "Discord message send latency, including rate-limit waits")
+QUEUE_DEPTH = Gauge('koru_dispatch_queue_depth', "Alerts waiting to be sent across all channels")
+
+# label is used for per-alert link buttons when alerts are packed together;
+# kind/tier/rank/price describe the event for subscription matching
+Alert = namedtuple(
+    'Alert', ['embed', 'mint', 'label', 'floor_sol', 'mention', 'kind', 'tier', 'rank', 'price'],
+    defaults=(None, None, None, None),
+)
+
+MAX_EMBEDS_PER_MESSAGE = 10
+
+
+class AlertDispatcher:
+    def __init__(self, build_view, max_embeds=MAX_EMBEDS_PER_MESSAGE, budget=None, idle_timeout=60.0):
+        """``build_view(alerts)`` returns the view for one outgoing message, or None."""
+        QUEUE_DEPTH.set_function(self.total_depth)
+        self.build_view = build_view
+        self.max_embeds = max_embeds
+        self.budget = budget
+        self.idle_timeout = idle_timeout
+        self._queues = {}   # channel id -> asyncio.Queue
+        self._workers = {}  # channel id -> asyncio.Task
+        self.sent_messages = 0
+        self.sent_alerts = 0
+        self.rate_limited = 0
+
+    def submit(self, channels, alerts, label=None):
+        """Queue ``alerts`` for every channel in ``channels`` without waiting.
+
+        ``label`` names the channels in metrics. It defaults to the channel id,
+        which suits the few configured alert channels; per-user DM and thread
+        targets pass a fixed label so the metrics don't grow with every user.
+        """
+        for channel in channels:
+            if channel is None:
+                continue
+            queue = self._queue_for(channel, label or channel.id)
+            for alert in alerts:
+                queue.put_nowait(alert)
+
+    @property
+    def workers(self):
+        """Number of channels with a live worker."""
+        return len(self._workers)
+
+    def depth(self):
+        """Number of alerts waiting, keyed by channel id."""
+        return {channel_id: queue.qsize() for channel_id, queue in self._queues.items()}
+
+    def total_depth(self):
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    async def join(self):
+        """Wait until every queued alert has been sent (or failed)."""
+        await asyncio.gather(*(queue.join() for queue in self._queues.values()))
+
+    async def close(self):
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+
+    def _queue_for(self, channel, label):
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = asyncio.Queue()
+        task = self._workers.get(channel.id)
+        if task is None or task.done():
+            self._workers[channel.id] = asyncio.create_task(self._worker(channel, queue, label))
+        return queue
+
+    async def _worker(self, channel, queue, label):
+        while True:
+            try:
+                first = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if not queue.empty():
+                    continue
+                # Nothing was awaited since the check, so no alert can slip in before the queue is dropped
+                del self._queues[channel.id]
+                del self._workers[channel.id]
+                return
+            batch = [first]
+            while len(batch) < self.max_embeds and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._send(channel, batch, label)
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    self.rate_limited += 1
+                SEND_FAILURES.inc(channel=label)
+                log.error("alert send failed", extra={'channel': channel.id, 'alerts': len(batch), 'error': str(e)})
+            except Exception as e:
+                SEND_FAILURES.inc(channel=label)
+                log.error("alert send failed", extra={'channel': channel.id, 'alerts': len(batch), 'error': str(e)})
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _send(self, channel, batch, label):
+        mentions = list(dict.fromkeys(alert.mention for alert in batch if alert.mention))
+        kwargs = {
+            "content": " ".join(mentions) or None,
+            "embeds": [alert.embed for alert in batch],
+        }
+        view = None
+        try:
+            view = self.build_view(batch)
+        except Exception:
+            pass
+        if view is not None:
+            kwargs["view"] = view
+        start = time.perf_counter()
+        if self.budget is not None:
+            await self.budget.acquire(priority=PRIORITY_ALERT)
+        await channel.send(**kwargs)
+        SEND_LATENCY.observe(time.perf_counter() - start)
+        ALERTS_SENT.inc(len(batch), channel=label)
+        self.sent_messages += 1
+        self.sent_alerts += len(batch)
+
+
+class _RateLimitCounter(logging.Filter):
+    """Counts the warning discord.py logs for every 429 it receives."""
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING and 'responded with 429' in str(record.msg):
+            DISCORD_429.inc()
+        return True
+
+
+def count_discord_rate_limits():
+    """discord.py retries 429s internally; hook its HTTP logger so they still show up in metrics."""
+    logging.getLogger('discord.http').addFilter(_RateLimitCounter())
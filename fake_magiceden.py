@@ -0,0 +1,377 @@
+"""Local stand-in for the Magic Eden endpoints the bot uses.
+
+Serves ``/v2/collections/{symbol}/activities``, ``/stats``, ``/listings``,
+``/holder_stats`` and ``/v2/tokens/{mint}`` from an in-memory collection,
+with configurable latency and error rate. ``burst(n)`` appends ``n`` new
+list/buy activities, so a benchmark can replay spikes without touching the
+live API. Point the bot at it with ``ME_API_BASE=http://127.0.0.1:8765``.
+
+``FakeSolanaRpc`` is the matching Solana RPC stand-in for the log stream. It
+answers ``logsSubscribe`` over a websocket and pushes a notification for
+every activity ``burst`` adds. It also answers ``getTransaction`` over HTTP
+POST. ``drop()`` and ``muted`` simulate a dropped or silently stalled stream,
+``send_raw()`` a malformed frame and ``unresolvable`` a node that has no
+transaction for the notifications it sent.
+
+Run standalone::
+
+    python fake_magiceden.py [--port 8765] [--latency-ms 40] [--error-rate 0.0] [--rpc-port 8899]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import WSMsgType, web
+
+
+class FakeMagicEden:
+    def __init__(self, symbol='koru', supply=3333, latency_ms=0.0, error_rate=0.0, seed=1):
+        self.symbol = symbol
+        self.supply = supply
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.floor_lamports = 1_500_000_000
+        self.activities = []  # newest last
+        self.calls = Counter()  # endpoint -> request count
+        self._rng = random.Random(seed)
+        self._next_sig = 0
+        self._runner = None
+        self.base_url = None
+        self.listeners = []  # called with the activities each burst adds
+        self.mints = [f"Mint{n:040d}" for n in range(1, supply + 1)]
+        self._numbers = {mint: n for n, mint in enumerate(self.mints, 1)}
+
+    def burst(self, count, list_ratio=0.6, with_metadata=False):
+        """Append ``count`` new activities with increasing blockTime. Returns them."""
+        now = int(time.time())
+        start = max(now, self.activities[-1]['blockTime'] + 1) if self.activities else now
+        added = []
+        for i in range(count):
+            number = self._rng.randint(1, self.supply)
+            mint = self.mints[number - 1]
+            is_list = self._rng.random() < list_ratio
+            self._next_sig += 1
+            item = {
+                'signature': f"sig{self._next_sig:012d}",
+                'type': 'list' if is_list else 'buyNow',
+                'source': 'magiceden_v2',
+                'tokenMint': mint,
+                'collection': self.symbol,
+                'slot': 250_000_000 + self._next_sig,
+                'blockTime': start + i,
+                'buyer': None if is_list else f"Buyer{self._rng.randint(1, 500)}",
+                'seller': f"Seller{self._rng.randint(1, 500)}",
+                'price': round(self._rng.uniform(1.0, 20.0), 3),
+            }
+            if with_metadata:
+                item['name'] = f"{self.symbol.title()} #{number}"
+                item['image'] = f"https://img.example/{number}.png"
+            added.append(item)
+        self.activities.extend(added)
+        for listener in self.listeners:
+            listener(added)
+        return added
+
+    def app(self):
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get('/v2/collections/{symbol}/activities', self._activities)
+        app.router.add_get('/v2/collections/{symbol}/stats', self._stats)
+        app.router.add_get('/v2/collections/{symbol}/listings', self._listings)
+        app.router.add_get('/v2/collections/{symbol}/holder_stats', self._holder_stats)
+        app.router.add_get('/v2/tokens/{mint}', self._token)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        endpoint = request.path.rstrip('/').rsplit('/', 1)[-1]
+        if request.path.startswith('/v2/tokens/'):
+            endpoint = 'token'
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            if self._rng.random() < 0.5:
+                return web.json_response({'error': 'rate limited'}, status=429, headers={'Retry-After': '1'})
+            return web.json_response({'error': 'upstream error'}, status=503)
+        return await handler(request)
+
+    async def _activities(self, request):
+        offset = int(request.query.get('offset', 0))
+        limit = int(request.query.get('limit', 100))
+        newest_first = self.activities[::-1]
+        return web.json_response(newest_first[offset:offset + limit])
+
+    async def _stats(self, request):
+        return web.json_response({
+            'symbol': request.match_info['symbol'],
+            'floorPrice': self.floor_lamports,
+            'listedCount': sum(1 for a in self.activities if a['type'] == 'list'),
+            'volumeAll': 0,
+        })
+
+    async def _listings(self, request):
+        offset = int(request.query.get('offset', 0))
+        limit = int(request.query.get('limit', 100))
+        listed = [a for a in self.activities if a['type'] == 'list'][offset:offset + limit]
+        return web.json_response([
+            {'tokenMint': a['tokenMint'], 'price': a['price'], 'token': self._token_json(a['tokenMint'])}
+            for a in listed
+        ])
+
+    async def _holder_stats(self, request):
+        holders = [
+            {'owner': f"Owner{n:039d}", 'tokens': 100 - n, 'ownerDisplay': {'sol': f"holder{n}.sol"} if n % 3 == 0 else {}}
+            for n in range(1, 51)
+        ]
+        return web.json_response({'symbol': request.match_info['symbol'], 'topHolders': holders})
+
+    async def _token(self, request):
+        mint = request.match_info['mint']
+        if mint not in self._numbers:
+            return web.json_response({'error': 'not found'}, status=404)
+        return web.json_response(self._token_json(mint))
+
+    def _token_json(self, mint):
+        number = self._numbers[mint]
+        return {
+            'mintAddress': mint,
+            'name': f"{self.symbol.title()} #{number}",
+            'image': f"https://img.example/{number}.png",
+            'collection': self.symbol,
+        }
+
+
+class FakeSolanaRpc:
+    """Websocket ``logsSubscribe`` and HTTP ``getTransaction`` for the activities of a ``FakeMagicEden``."""
+
+    def __init__(self, market, program_id='M2mx93ekt1fmXSVkTrUL9xVFHkmME8HTUi5Cyc5aF7K', latency_ms=0.0):
+        self.market = market
+        self.program_id = program_id
+        self.latency = latency_ms / 1000.0
+        self.muted = False  # while set, activities happen but no notification goes out
+        self.unresolvable = False  # while set, activities are notified but getTransaction returns null
+        self._missing = set()
+        self.calls = Counter()  # RPC method -> request count
+        self._by_signature = {}
+        self._sockets = []  # (websocket, queue of notifications)
+        self._next_sub = 0
+        self._runner = None
+        self.ws_url = None
+        self.http_url = None
+        market.listeners.append(self._publish)
+
+    @property
+    def subscribers(self):
+        return len(self._sockets)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/', self._websocket)
+        app.router.add_post('/', self._rpc)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.ws_url = f"ws://{host}:{port}/"
+        self.http_url = f"http://{host}:{port}/"
+        return self.ws_url
+
+    async def stop(self):
+        await self.drop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def drop(self):
+        """Close every subscriber's socket, as a flaky RPC node would."""
+        sockets, self._sockets = self._sockets, []
+        for ws, _ in sockets:
+            await ws.close()
+
+    def logs_for(self, item):
+        """Program logs for one activity, as M2 writes them."""
+        lamports = int(round(item['price'] * 1_000_000_000))
+        invoke = [f"Program {self.program_id} invoke [1]"]
+        if item['type'] == 'list':
+            body = ["Program log: Instruction: Sell", f'Program log: {{"price":{lamports},"seller_expiry":-1}}']
+        else:
+            body = ["Program log: Instruction: BuyV2", f'Program log: {{"price":{lamports},"buyer_expiry":0}}',
+                    "Program log: Instruction: ExecuteSaleV2", f'Program log: {{"price":{lamports},"seller_expiry":-1}}']
+        return invoke + body + [f"Program {self.program_id} success"]
+
+    def send_raw(self, data):
+        """Push ``data`` to every subscriber as is, e.g. a malformed frame."""
+        for _, queue in self._sockets:
+            queue.put_nowait(data)
+
+    def _publish(self, added):
+        for item in added:
+            self._by_signature[item['signature']] = item
+            if self.unresolvable:
+                self._missing.add(item['signature'])
+        if self.muted:
+            return
+        for item in added:
+            for _, queue in self._sockets:
+                queue.put_nowait(item)
+
+    def _notification(self, item, subscription):
+        return {
+            'jsonrpc': '2.0',
+            'method': 'logsNotification',
+            'params': {
+                'result': {
+                    'context': {'slot': item['slot']},
+                    'value': {'signature': item['signature'], 'err': None, 'logs': self.logs_for(item)},
+                },
+                'subscription': subscription,
+            },
+        }
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        queue = asyncio.Queue()
+        entry = (ws, queue)
+        sender = None
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                call = json.loads(message.data)
+                self.calls[call.get('method')] += 1
+                if call.get('method') != 'logsSubscribe' or sender is not None:
+                    await ws.send_json({'jsonrpc': '2.0', 'id': call.get('id'),
+                                        'error': {'code': -32601, 'message': 'Method not found'}})
+                    continue
+                self._next_sub += 1
+                await ws.send_json({'jsonrpc': '2.0', 'id': call.get('id'), 'result': self._next_sub})
+                self._sockets.append(entry)
+                sender = asyncio.create_task(self._send(ws, queue, self._next_sub))
+        finally:
+            if entry in self._sockets:
+                self._sockets.remove(entry)
+            if sender is not None:
+                sender.cancel()
+        return ws
+
+    async def _send(self, ws, queue, subscription):
+        while True:
+            item = await queue.get()
+            if isinstance(item, str):
+                await ws.send_str(item)
+            else:
+                await ws.send_json(self._notification(item, subscription))
+
+    async def _rpc(self, request):
+        call = await request.json()
+        method = call.get('method')
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method != 'getTransaction':
+            return web.json_response({'jsonrpc': '2.0', 'id': call.get('id'),
+                                      'error': {'code': -32601, 'message': 'Method not found'}})
+        signature = call['params'][0]
+        item = self._by_signature.get(signature) if signature not in self._missing else None
+        return web.json_response({'jsonrpc': '2.0', 'id': call.get('id'),
+                                  'result': self._transaction(item) if item else None})
+
+    def _transaction(self, item):
+        def balance(owner):
+            return {'accountIndex': 2, 'mint': item['tokenMint'], 'owner': owner,
+                    'uiTokenAmount': {'amount': '1', 'decimals': 0, 'uiAmount': 1.0}}
+
+        is_list = item['type'] == 'list'
+        signer = item['seller'] if is_list else item['buyer']
+        return {
+            'slot': item['slot'],
+            'blockTime': item['blockTime'],
+            'meta': {
+                'err': None,
+                'logMessages': self.logs_for(item),
+                'preTokenBalances': [balance(item['seller'])],
+                'postTokenBalances': [balance(item['seller'] if is_list else item['buyer'])],
+            },
+            'transaction': {
+                'signatures': [item['signature']],
+                'message': {'accountKeys': [
+                    {'pubkey': signer, 'signer': True, 'writable': True},
+                    {'pubkey': self.program_id, 'signer': False, 'writable': False},
+                ]},
+            },
+        }
+
+
+class FakeChannel:
+    """Stand-in for a discord TextChannel that records sends instead of making them."""
+
+    def __init__(self, channel_id, latency_ms=0.0):
+        self.id = channel_id
+        self.latency = latency_ms / 1000.0
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append({'content': content, 'sent_at': time.monotonic(), **kwargs})
+
+    @property
+    def alerts_received(self):
+        return sum(len(msg.get('embeds') or [msg.get('embed')]) for msg in self.sent)
+
+
+async def _serve(args):
+    fake = FakeMagicEden(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    fake.burst(args.initial)
+    url = await fake.start(port=args.port)
+    print(f"Fake Magic Eden listening on {url} ({len(fake.activities)} activities)")
+    rpc = FakeSolanaRpc(fake)
+    ws_url = await rpc.start(port=args.rpc_port)
+    print(f"Fake Solana RPC listening on {ws_url} (set SOLANA_WS_URL)")
+    try:
+        while True:
+            if args.burst_every <= 0:
+                await asyncio.sleep(3600)
+                continue
+            await asyncio.sleep(args.burst_every)
+            fake.burst(args.burst_size)
+    finally:
+        await rpc.stop()
+        await fake.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a fake Magic Eden API locally.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=40.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rpc-port', type=int, default=8899)
+    parser.add_argument('--initial', type=int, default=20)
+    parser.add_argument('--burst-every', type=float, default=30.0, help="seconds between bursts (0 disables)")
+    parser.add_argument('--burst-size', type=int, default=10)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,176 @@
+"""Request governor for the Magic Eden API.
+
+All calls share one ``TokenBucket`` for the API key (or IP, without a key):
+
+- Background endpoints queue behind the ones alerts wait on.
+- A 429 pauses every endpoint until ``Retry-After`` has passed (or a
+  jittered exponential backoff, without the header). It also halves the
+  request rate, which then creeps back up on successes (AIMD). Throughput
+  settles just under the real limit instead of bouncing off it.
+- 5xx responses, timeouts and connection errors are retried with jittered
+  exponential backoff. They also count towards that endpoint's
+  ``CircuitBreaker``. While a breaker is open, calls fail immediately instead
+  of spending budget on an endpoint that is down.
+
+The remaining budget, current rate and breaker states are exported as metrics.
+"""
+import asyncio
+import email.utils
+import random
+import time
+
+from metrics import Counter, Gauge
+from ratelimit import PRIORITY_ALERT, PRIORITY_BACKGROUND, TokenBucket
+
+ME_BUDGET_REMAINING = Gauge('koru_me_budget_remaining', "Magic Eden request tokens available right now")
+ME_RATE = Gauge('koru_me_rate_per_second', "Current Magic Eden request rate (lowered after 429s)")
+ME_RETRIES = Counter('koru_me_retries_total', "Magic Eden requests retried", ['endpoint', 'reason'])
+ME_CIRCUIT_OPEN = Gauge('koru_me_circuit_open', "1 while an endpoint's circuit breaker is open", ['endpoint'])
+
+# Endpoints nothing time-critical waits on
+BACKGROUND_ENDPOINTS = {'holder_stats', 'listings'}
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures for ``reset_timeout`` seconds.
+
+    Once the timeout has passed a single trial call is let through
+    (half-open). Success closes the breaker; failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def retry_in(self):
+        """Seconds until a call may go through (0 if one may go now)."""
+        if self.opened_at is None:
+            return 0.0
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if remaining > 0:
+            return remaining
+        if self._trial:
+            # A trial call is already in flight; everyone else waits for its outcome
+            return 1.0
+        self._trial = True
+        return 0.0
+
+    def release_trial(self):
+        """The trial call ended without a verdict (a 429, or it was cancelled); let another one through."""
+        self._trial = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class RequestGovernor:
+    def __init__(self, rate=2.0, burst=10, max_retries=3, base_delay=0.5, max_delay=30.0,
+                 failure_threshold=5, reset_timeout=30.0, min_rate=None):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate if min_rate is not None else rate / 8)
+        self.bucket = TokenBucket(rate, capacity=burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._cooldown_until = 0.0
+        ME_BUDGET_REMAINING.set_function(lambda: self.remaining)
+        ME_RATE.set_function(lambda: self.bucket.rate)
+
+    @property
+    def remaining(self):
+        """Requests that could be sent right now without waiting."""
+        if time.monotonic() < self._cooldown_until:
+            return 0.0
+        return self.bucket.available
+
+    def breaker(self, endpoint):
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            ME_CIRCUIT_OPEN.set_function(lambda: int(breaker.is_open), endpoint=endpoint)
+        return breaker
+
+    async def acquire(self, endpoint):
+        """Wait for any 429 cooldown and for a token."""
+        while True:
+            wait = self._cooldown_until - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        priority = PRIORITY_BACKGROUND if endpoint in BACKGROUND_ENDPOINTS else PRIORITY_ALERT
+        await self.bucket.acquire(priority=priority)
+
+    def success(self, endpoint):
+        self.breaker(endpoint).record_success()
+        # Additive increase: win back the rate a 429 cost, a little per success
+        if self.bucket.rate < self.max_rate:
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate / 100)
+
+    def failure(self, endpoint, status=None, retry_after=None, attempt=0):
+        """Record a failed attempt. Returns how long to wait before retrying, or None to give up."""
+        if status == 429:
+            # The limit is per key, not per endpoint: everyone backs off, and the rate halves
+            delay = self.backoff(attempt, retry_after)
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+            self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+            # Says nothing about whether the endpoint is back; a half-open breaker tries again
+            self.breaker(endpoint).release_trial()
+            reason = '429'
+        elif status is None or status >= 500:
+            self.breaker(endpoint).record_failure()
+            if self.breaker(endpoint).is_open:
+                return None
+            delay = self.backoff(attempt, retry_after)
+            reason = 'error' if status is None else '5xx'
+        else:
+            # Any other 4xx is an answer, not an outage
+            self.breaker(endpoint).record_success()
+            return None
+        if attempt >= self.max_retries:
+            return None
+        ME_RETRIES.inc(endpoint=endpoint, reason=reason)
+        return delay
+
+    def backoff(self, attempt, retry_after=None):
+        """Jittered exponential delay for ``attempt`` (0-based), never shorter than ``retry_after``."""
+        return backoff_delay(attempt, self.base_delay, self.max_delay, retry_after)
+
+
+def backoff_delay(attempt, base_delay, max_delay, retry_after=None):
+    """Somewhere in the upper half of ``base_delay * 2 ** attempt`` (capped at ``max_delay``)."""
+    ceiling = min(max_delay, base_delay * 2 ** attempt)
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    return max(delay, retry_after or 0.0)
+
+
+def parse_retry_after(value):
+    """``Retry-After`` header (seconds or an HTTP date) -> seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
@@ -0,0 +1,200 @@
+"""Top-holder snapshot for one collection, refreshed in the background.
+
+``/v2/collections/{symbol}/holder_stats`` is fetched on a schedule, kept in
+memory and written to ``data/holders-<symbol>.json`` so a restart has
+something to answer with and something to diff against. The ``/topholders``
+embed is rendered once per refresh, so the command never touches the API.
+
+Each refresh is diffed against the previous snapshot; holders whose position
+moved by at least ``min_delta`` tokens come back as ``HolderChange`` rows for
+the bot to announce.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import discord
+
+from metadata_cache import DATA_DIR
+from metrics import Counter, Gauge
+
+log = logging.getLogger('koru.holders')
+
+HOLDER_REFRESHES = Counter('koru_holder_refreshes_total', "Holder snapshot refreshes by result", ['result'])
+HOLDER_SNAPSHOT_AGE = Gauge('koru_holder_snapshot_age_seconds', "Age of the holder snapshot", ['collection'])
+
+Holder = namedtuple('Holder', ['owner', 'tokens', 'display'])
+# ``before``/``after`` are None when the holder entered or left the top list
+HolderChange = namedtuple('HolderChange', ['owner', 'display', 'before', 'after'])
+
+TOP_HOLDERS_SHOWN = 25
+
+
+def parse_holders(data):
+    """``holder_stats`` response -> list of Holder, largest first."""
+    holders = []
+    for entry in (data or {}).get('topHolders') or []:
+        owner = entry.get('owner')
+        if not owner:
+            continue
+        owner_display = entry.get('ownerDisplay')
+        sol_domain = owner_display.get('sol') if isinstance(owner_display, dict) else None
+        holders.append(Holder(owner, int(entry.get('tokens') or 0), sol_domain))
+    holders.sort(key=lambda h: h.tokens, reverse=True)
+    return holders
+
+
+def display_name(holder):
+    # Prefer sol domain if available
+    return holder.display or f"{holder.owner[:4]}...{holder.owner[-4:]}"
+
+
+def diff_holders(old, new, min_delta=5):
+    """Position changes of at least ``min_delta`` tokens between two holder lists.
+
+    ``holder_stats`` only covers the top of the list, so a newcomer's previous
+    count (``before``) and a dropout's new count (``after``) are unknown and
+    reported as None. For those the smallest count still on the other list
+    bounds the move, which keeps ordinary churn at the cut-off quiet. Largest
+    moves come first.
+    """
+    old_by_owner = {h.owner: h for h in old}
+    new_by_owner = {h.owner: h for h in new}
+    # Anyone missing from a list holds at most that list's smallest position
+    old_cutoff = min((h.tokens for h in old), default=0)
+    new_cutoff = min((h.tokens for h in new), default=0)
+    changes = []
+    for owner, holder in new_by_owner.items():
+        prev = old_by_owner.get(owner)
+        if prev is None:
+            if holder.tokens - old_cutoff >= min_delta:
+                changes.append(HolderChange(owner, holder.display, None, holder.tokens))
+        elif abs(holder.tokens - prev.tokens) >= min_delta:
+            changes.append(HolderChange(owner, holder.display or prev.display, prev.tokens, holder.tokens))
+    for owner, prev in old_by_owner.items():
+        if owner not in new_by_owner and prev.tokens - new_cutoff >= min_delta:
+            changes.append(HolderChange(owner, prev.display, prev.tokens, None))
+    changes.sort(key=lambda c: abs((c.after or 0) - (c.before or 0)), reverse=True)
+    return changes
+
+
+class HolderSnapshot:
+    """Holder list for ``symbol``, refreshed by ``refresh()`` and persisted to ``path``."""
+
+    def __init__(self, client, symbol, name=None, path=None, min_delta=5):
+        self.client = client
+        self.symbol = symbol
+        self.name = name or symbol.title()
+        self.path = path or os.path.join(DATA_DIR, f"holders-{symbol}.json")
+        self.min_delta = min_delta
+        self.holders = []
+        self.taken_at = None  # unix time of the snapshot
+        self.embed = None
+        self._inflight = None
+        HOLDER_SNAPSHOT_AGE.set_function(self.age, collection=symbol)
+
+    def age(self):
+        return time.time() - self.taken_at if self.taken_at else float('nan')
+
+    def load(self):
+        """Load the last snapshot written to disk, if any."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            holders = [Holder(*h) for h in saved.get('holders', [])]
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            # Unreadable or from an older layout: start empty until the next refresh
+            log.error("could not read holder snapshot", extra={'path': self.path, 'error': str(e)})
+            return False
+        self.holders = holders
+        self.taken_at = saved.get('taken_at')
+        self.embed = self._render()
+        return True
+
+    def refresh(self):
+        """Fetch a new snapshot; concurrent callers share one request.
+
+        Returns a task resolving to the list of ``HolderChange`` since the
+        previous snapshot (empty on the first one).
+        """
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._load())
+            self._inflight.add_done_callback(self._on_done)
+        return self._inflight
+
+    async def _load(self):
+        holders = parse_holders(await self.client.holder_stats(self.symbol))
+        if not holders:
+            # Keep serving the last good snapshot rather than an empty one
+            raise ValueError("holder_stats returned no holders")
+        changes = diff_holders(self.holders, holders, self.min_delta) if self.holders else []
+        self.holders = holders
+        self.taken_at = time.time()
+        self.embed = self._render()
+        self._save()
+        return changes
+
+    def _on_done(self, task):
+        self._inflight = None
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            HOLDER_REFRESHES.inc(result='error')
+            log.error("holder refresh failed", extra={'collection': self.symbol, 'error': str(task.exception())})
+        else:
+            HOLDER_REFRESHES.inc(result='ok')
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'symbol': self.symbol, 'taken_at': self.taken_at,
+                       'holders': [list(h) for h in self.holders]}, f)
+        os.replace(tmp, self.path)
+
+    def _render(self):
+        if not self.holders:
+            return None
+        embed = discord.Embed(
+            title=f"Top {self.name} NFT Holders",
+            description=f"Here are the top {TOP_HOLDERS_SHOWN} holders by number of NFTs held.",
+            color=0x3498db
+        )
+        for idx, holder in enumerate(self.holders[:TOP_HOLDERS_SHOWN], 1):
+            embed.add_field(
+                name=f"#{idx}: {display_name(holder)}",
+                value=f"NFTs: **{holder.tokens}** | [Solscan](https://solscan.io/account/{holder.owner})",
+                inline=False
+            )
+        if self.taken_at:
+            embed.timestamp = datetime.fromtimestamp(self.taken_at, tz=timezone.utc)
+            embed.set_footer(text="Snapshot taken")
+        return embed
+
+
+def changes_embed(name, changes, limit=15):
+    """Announcement embed for large holder position changes."""
+    lines = []
+    for change in changes[:limit]:
+        link = f"[{display_name(change)}](https://solscan.io/account/{change.owner})"
+        if change.before is None:
+            lines.append(f"🆕 {link} entered the top holders with **{change.after}**")
+        elif change.after is None:
+            lines.append(f"📤 {link} left the top holders (had **{change.before}**)")
+        else:
+            delta = change.after - change.before
+            arrow = "📈" if delta > 0 else "📉"
+            lines.append(f"{arrow} {link} **{change.before} → {change.after}** ({delta:+d})")
+    if len(changes) > limit:
+        lines.append(f"…and {len(changes) - limit} more")
+    return discord.Embed(
+        title=f"🐋 {name} holder moves",
+        description="\n".join(lines),
+        color=0x3498db
+    )
@@ -0,0 +1,162 @@
+"""Persistent journal of announced events.
+
+Every announced activity is written to SQLite (WAL mode) and mirrored in a
+bounded in-memory window, so duplicate checks are O(1) dict lookups and
+survive restarts. Rows are evicted by age and by count.
+
+Inspect or replay the journal from the command line::
+
+    python journal.py inspect [--limit N]
+    python journal.py replay [--since UNIX_TS] [--type list|buyNow]
+    python journal.py prune
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+
+from metadata_cache import DATA_DIR
+
+JOURNAL_DB_PATH = os.path.join(DATA_DIR, 'event-journal.sqlite3')
+
+
+class EventJournal:
+    def __init__(self, path=JOURNAL_DB_PATH, window_size=5000, max_rows=100_000, max_age_days=30):
+        self.path = path
+        self.window_size = window_size
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_days * 86400
+        self._window = OrderedDict()  # key -> None, newest last
+        self._db = None
+
+    def open(self):
+        if self._db is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " key TEXT PRIMARY KEY, scope TEXT NOT NULL, type TEXT, mint TEXT,"
+            " block_time INTEGER, recorded_at REAL NOT NULL, payload TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_recorded_at ON events (recorded_at)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        # Prime the window with the most recent keys so restarts keep dedupe state
+        rows = self._db.execute(
+            "SELECT key FROM events ORDER BY recorded_at DESC LIMIT ?", (self.window_size,)
+        ).fetchall()
+        for (key,) in reversed(rows):
+            self._window[key] = None
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def is_empty(self, scope):
+        return self._db.execute("SELECT 1 FROM events WHERE scope = ? LIMIT 1", (scope,)).fetchone() is None
+
+    def seen(self, key):
+        if key in self._window:
+            return True
+        # Older than the window: fall back to the primary-key index
+        return self._db.execute("SELECT 1 FROM events WHERE key = ?", (key,)).fetchone() is not None
+
+    def record(self, scope, key, item):
+        self.record_many(scope, [(key, item)])
+
+    def record_many(self, scope, entries):
+        """Store ``(key, activity)`` pairs for ``scope`` in one transaction."""
+        now = time.time()
+        rows = [
+            (key, scope, item.get('type'), item.get('tokenMint'), item.get('blockTime'), now, json.dumps(item))
+            for key, item in entries
+        ]
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO events (key, scope, type, mint, block_time, recorded_at, payload)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        for key, _ in entries:
+            self._window[key] = None
+            self._window.move_to_end(key)
+        while len(self._window) > self.window_size:
+            self._window.popitem(last=False)
+
+    def get_meta(self, key, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def prune(self):
+        """Evict rows older than ``max_age_days`` and beyond ``max_rows``. Returns rows removed."""
+        cutoff = time.time() - self.max_age_seconds
+        with self._db:
+            removed = self._db.execute("DELETE FROM events WHERE recorded_at < ?", (cutoff,)).rowcount
+            removed += self._db.execute(
+                "DELETE FROM events WHERE key IN ("
+                " SELECT key FROM events ORDER BY recorded_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            ).rowcount
+        return removed
+
+    def iter_events(self, since=None, event_type=None, limit=None, newest_first=False):
+        query = "SELECT key, scope, type, mint, block_time, recorded_at, payload FROM events WHERE 1=1"
+        params = []
+        if since is not None:
+            query += " AND recorded_at >= ?"
+            params.append(since)
+        if event_type:
+            query += " AND type = ?"
+            params.append(event_type)
+        query += " ORDER BY recorded_at DESC" if newest_first else " ORDER BY recorded_at"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        yield from self._db.execute(query, params)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or replay the event journal.")
+    parser.add_argument('--db', default=JOURNAL_DB_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    inspect_cmd = sub.add_parser('inspect', help="summary plus the most recent events")
+    inspect_cmd.add_argument('--limit', type=int, default=20)
+    replay_cmd = sub.add_parser('replay', help="print journaled activities as JSON lines, oldest first")
+    replay_cmd.add_argument('--since', type=float, default=None, help="unix timestamp")
+    replay_cmd.add_argument('--type', dest='event_type', default=None)
+    sub.add_parser('prune', help="apply age/count eviction now")
+    args = parser.parse_args(argv)
+
+    journal = EventJournal(args.db)
+    journal.open()
+    try:
+        if args.command == 'inspect':
+            print(f"{len(journal)} events in {args.db}")
+            for key, scope, event_type, mint, block_time, recorded_at, _ in journal.iter_events(limit=args.limit, newest_first=True):
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(recorded_at))
+                print(f"{stamp}  {scope:<12} {event_type or '?':<8} {mint or '?':<44} {key}")
+        elif args.command == 'replay':
+            for row in journal.iter_events(since=args.since, event_type=args.event_type):
+                sys.stdout.write(row[6] + "\n")
+        elif args.command == 'prune':
+            print(f"Removed {journal.prune()} events.")
+    finally:
+        journal.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Leveled, structured logging for the bot.
+
+Log calls pass context as ``extra={...}``; the formatter appends it as
+``key=value`` pairs (or JSON with ``LOG_FORMAT=json``). ``LOG_LEVEL`` sets the
+level; per-event lines on the polling hot path are DEBUG and guarded with
+``isEnabledFor`` so they cost nothing at the default INFO level.
+"""
+import json
+import logging
+import os
+import time
+
+# Attributes every LogRecord has; anything else came from ``extra``
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED}
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        stamp = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created))
+        line = f"{stamp}Z {record.levelname:<5} {record.name} {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{k}={_kv(v)}" for k, v in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _kv(value):
+    text = str(value)
+    return json.dumps(text) if (' ' in text or '"' in text or not text) else text
+
+
+def configure_logging(level=None, fmt=None):
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'text')).lower()
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else KeyValueFormatter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    # discord.py is chatty at INFO; keep it to warnings unless we are debugging
+    logging.getLogger('discord').setLevel(level if level == 'DEBUG' else 'WARNING')
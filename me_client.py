@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+
+from governor import RequestGovernor, parse_retry_after
+from metrics import Counter, Histogram
+
+try:
+    import orjson
+
+    def loads_json(raw):
+        return orjson.loads(raw)
+except ImportError:  # orjson is optional, fall back to the stdlib decoder
+    import json
+
+    def loads_json(raw):
+        return json.loads(raw)
+
+
+ME_API_BASE = os.getenv('ME_API_BASE', 'https://api-mainnet.magiceden.dev')
+# Optional API key; the request budget below is per key (or per IP without one)
+ME_API_KEY = os.getenv('ME_API_KEY')
+# Public API limit is 120 requests/minute; raise these for a key with a higher tier
+ME_REQUESTS_PER_SECOND = float(os.getenv('ME_REQUESTS_PER_SECOND', '2'))
+ME_BURST = int(os.getenv('ME_BURST', '10'))
+
+# Per-endpoint timeouts (seconds). Activities sit on the hot path of every tick,
+# holder_stats is slow on Magic Eden's side and only used by /topholders.
+ENDPOINT_TIMEOUTS = {
+    "activities": aiohttp.ClientTimeout(total=10, connect=3),
+    "stats": aiohttp.ClientTimeout(total=5, connect=3),
+    "token": aiohttp.ClientTimeout(total=5, connect=3),
+    "holder_stats": aiohttp.ClientTimeout(total=10, connect=3),
+    "listings": aiohttp.ClientTimeout(total=15, connect=3),
+}
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3)
+
+ME_REQUESTS = Counter('koru_me_requests_total', "Magic Eden requests by endpoint and HTTP status",
+                      ['endpoint', 'status'])
+ME_LATENCY = Histogram('koru_me_request_seconds', "Magic Eden request latency", ['endpoint'])
+
+
+class MagicEdenError(Exception):
+    """Raised when Magic Eden answers with a non-200 status."""
+
+    def __init__(self, endpoint, status):
+        super().__init__(f"{endpoint} returned HTTP {status}")
+        self.endpoint = endpoint
+        self.status = status
+
+
+class CircuitOpenError(MagicEdenError):
+    """Raised without a request while an endpoint's circuit breaker is open."""
+
+    def __init__(self, endpoint, retry_in):
+        Exception.__init__(self, f"{endpoint} circuit open, retrying in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.status = None
+        self.retry_in = retry_in
+
+
+class MagicEdenClient:
+    """Long-lived, pooled HTTP client for every Magic Eden call the bot makes.
+
+    One ``aiohttp.ClientSession`` is opened in ``start()`` and reused until
+    ``close()``, so DNS lookups, TCP connections and TLS sessions survive
+    across ticks instead of being rebuilt per request. Every request goes
+    through ``governor`` (see governor.py) for rate limiting, retries and
+    circuit breaking.
+    """
+
+    def __init__(self, base_url=ME_API_BASE, max_connections=20, keepalive_timeout=60, governor=None):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.governor = governor or RequestGovernor(rate=ME_REQUESTS_PER_SECOND, burst=ME_BURST)
+        self._session = None
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections,
+            ttl_dns_cache=300,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        headers = {"accept": "application/json"}
+        if ME_API_KEY:
+            headers["Authorization"] = f"Bearer {ME_API_KEY}"
+        self._session = aiohttp.ClientSession(connector=connector, headers=headers)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            raise RuntimeError("MagicEdenClient.start() has not been awaited")
+        return self._session
+
+    async def request(self, endpoint, path, params=None):
+        """GET ``path`` and return the decoded JSON body.
+
+        ``endpoint`` is a short name used to pick the timeout and the circuit
+        breaker. 429s, 5xx and transport errors are retried with backoff;
+        raises ``MagicEdenError`` once retries are exhausted or on any other
+        non-200 response, and ``CircuitOpenError`` while the endpoint is down.
+        """
+        timeout = ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        governor = self.governor
+        attempt = 0
+        while True:
+            breaker = governor.breaker(endpoint)
+            retry_in = breaker.retry_in()
+            if retry_in > 0:
+                ME_REQUESTS.inc(endpoint=endpoint, status='circuit_open')
+                raise CircuitOpenError(endpoint, retry_in)
+            settled = False  # whether the governor has judged this attempt
+            try:
+                await governor.acquire(endpoint)
+                status = 'error'
+                retry_after = None
+                start = time.perf_counter()
+                try:
+                    async with self.session.get(f"{self.base_url}{path}", params=params, timeout=timeout) as resp:
+                        status = resp.status
+                        if resp.status == 200:
+                            body = await resp.read()
+                            governor.success(endpoint)
+                            settled = True
+                            return loads_json(body)
+                        retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+                    error = MagicEdenError(endpoint, status)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                finally:
+                    ME_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+                    ME_REQUESTS.inc(endpoint=endpoint, status=status)
+                delay = governor.failure(endpoint, None if status == 'error' else status, retry_after, attempt)
+                settled = True
+            finally:
+                if not settled:
+                    # Cancelled mid-attempt: a half-open trial must not stay claimed forever
+                    breaker.release_trial()
+            if delay is None:
+                raise error
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def activities(self, symbol, limit=10, offset=0):
+        return await self.request(
+            "activities",
+            f"/v2/collections/{symbol}/activities",
+            params={"offset": offset, "limit": limit},
+        )
+
+    async def collection_stats(self, symbol):
+        return await self.request("stats", f"/v2/collections/{symbol}/stats")
+
+    async def token(self, mint):
+        return await self.request("token", f"/v2/tokens/{mint}")
+
+    async def listings(self, symbol, limit=100, offset=0):
+        return await self.request(
+            "listings",
+            f"/v2/collections/{symbol}/listings",
+            params={"offset": offset, "limit": limit},
+        )
+
+    async def holder_stats(self, symbol):
+        return await self.request("holder_stats", f"/v2/collections/{symbol}/holder_stats")
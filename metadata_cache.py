@@ -0,0 +1,201 @@
+"""Token metadata cache: mint -> name / image / parsed NFT number.
+
+A bounded in-memory LRU sits in front of a small SQLite table so metadata
+survives restarts and popular mints are only ever fetched once.
+
+Warm the cache from the command line with::
+
+    python metadata_cache.py warm koru              # everything currently listed
+    python metadata_cache.py warm koru hashlist.json  # every mint in a hashlist
+"""
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import OrderedDict, namedtuple
+
+from me_client import MagicEdenError
+
+log = logging.getLogger('koru.metadata')
+
+DATA_DIR = os.getenv('KORU_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+METADATA_DB_PATH = os.path.join(DATA_DIR, 'token-metadata.sqlite3')
+
+TokenMeta = namedtuple('TokenMeta', ['mint', 'name', 'image', 'number'])
+
+_NUMBER_RE = re.compile(r'#(\d+)')
+
+
+def parse_nft_number(name):
+    """Extract the NFT number from a name like "Koru #1234"."""
+    if not name:
+        return None
+    match = _NUMBER_RE.search(name)
+    return int(match.group(1)) if match else None
+
+
+class TokenMetadataCache:
+    def __init__(self, path=METADATA_DB_PATH, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._db = None
+
+    def open(self):
+        if self._db is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS token_meta ("
+            " mint TEXT PRIMARY KEY, name TEXT, image TEXT, number INTEGER, updated_at REAL)"
+        )
+        self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM token_meta").fetchone()[0]
+
+    def get(self, mint):
+        meta = self._lru.get(mint)
+        if meta is not None:
+            self._lru.move_to_end(mint)
+            return meta
+        row = self._db.execute(
+            "SELECT name, image, number FROM token_meta WHERE mint = ?", (mint,)
+        ).fetchone()
+        if row is None:
+            return None
+        meta = TokenMeta(mint, *row)
+        self._remember(meta)
+        return meta
+
+    def put(self, mint, name, image):
+        meta = TokenMeta(mint, name, image, parse_nft_number(name))
+        self.put_many([meta])
+        return meta
+
+    def put_many(self, metas):
+        """Store several entries in one transaction."""
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO token_meta (mint, name, image, number, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(m.mint, m.name, m.image, m.number, now) for m in metas],
+            )
+        for meta in metas:
+            self._remember(meta)
+
+    async def resolve(self, client, mint, name=None, image=None):
+        """Return metadata for ``mint``, preferring values already on the activity.
+
+        Only mints that are unknown and missing a name or image hit
+        ``/v2/tokens/{mint}``. The result is cached, so the number is parsed
+        once per mint.
+        """
+        cached = self.get(mint)
+        if cached is not None:
+            return TokenMeta(mint, name or cached.name, image or cached.image, cached.number)
+        # Only cache what is complete: a failed fetch would otherwise pin a missing image forever
+        complete = bool(name and image)
+        if not complete:
+            try:
+                meta = await client.token(mint)
+                if not name:
+                    name = meta.get('name', mint)
+                if not image:
+                    image = meta.get('image')
+                complete = True
+            except MagicEdenError:
+                pass
+            except Exception as e:
+                log.error("metadata fetch failed", extra={'mint': mint, 'error': str(e)})
+        if not name:
+            return TokenMeta(mint, None, image, None)
+        if not complete:
+            return TokenMeta(mint, name, image, parse_nft_number(name))
+        return self.put(mint, name, image)
+
+    async def warm_from_listings(self, client, symbol, page_size=100):
+        """Preload every token currently listed for ``symbol``. Returns the count stored."""
+        stored = 0
+        offset = 0
+        while True:
+            page = await client.listings(symbol, limit=page_size, offset=offset)
+            metas = []
+            for listing in page:
+                token = listing.get('token') or {}
+                mint = listing.get('tokenMint') or token.get('mintAddress')
+                if mint and token.get('name'):
+                    metas.append(TokenMeta(mint, token['name'], token.get('image'), parse_nft_number(token['name'])))
+            if metas:
+                self.put_many(metas)
+                stored += len(metas)
+            if len(page) < page_size:
+                return stored
+            offset += page_size
+
+    async def warm_from_mints(self, client, mints, concurrency=8):
+        """Fetch metadata for every unknown mint in ``mints``. Returns the count stored."""
+        known = {row[0] for row in self._db.execute("SELECT mint FROM token_meta")}
+        todo = [m for m in mints if m not in known]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(mint):
+            async with semaphore:
+                try:
+                    meta = await client.token(mint)
+                except Exception as e:
+                    log.error("metadata fetch failed", extra={'mint': mint, 'error': str(e)})
+                    return None
+                if not meta.get('name'):
+                    return None
+                return TokenMeta(mint, meta['name'], meta.get('image'), parse_nft_number(meta['name']))
+
+        metas = [m for m in await asyncio.gather(*(fetch(m) for m in todo)) if m is not None]
+        if metas:
+            self.put_many(metas)
+        return len(metas)
+
+    def _remember(self, meta):
+        self._lru[meta.mint] = meta
+        self._lru.move_to_end(meta.mint)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+
+async def _warm_main(symbol, hashlist_path=None):
+    import json
+    from me_client import MagicEdenClient
+
+    client = MagicEdenClient()
+    cache = TokenMetadataCache()
+    cache.open()
+    await client.start()
+    try:
+        if hashlist_path:
+            with open(hashlist_path, 'r', encoding='utf-8') as f:
+                mints = json.load(f)
+            stored = await cache.warm_from_mints(client, mints)
+        else:
+            stored = await cache.warm_from_listings(client, symbol)
+        print(f"Cached metadata for {stored} tokens ({len(cache)} total).")
+    finally:
+        await client.close()
+        cache.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'warm':
+        print("usage: python metadata_cache.py warm <collection> [hashlist.json]")
+        sys.exit(2)
+    asyncio.run(_warm_main(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
@@ -0,0 +1,177 @@
+"""In-process metrics with a Prometheus text-format endpoint.
+
+Counters, gauges and histograms are registered in ``REGISTRY`` at import
+time by the modules that own them and rendered on ``GET /metrics`` by
+``start_metrics_server``. Updating a metric is a dict lookup and an add, so it
+is safe to call on the hot path.
+"""
+import bisect
+import os
+
+from aiohttp import web
+
+# Seconds; covers sub-ms cache hits up to slow timeouts
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=(), registry=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if tuple(sorted(labels)) != tuple(sorted(self.labelnames)):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _fmt_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        body = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+        return '{' + body + '}'
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{self._fmt_labels(key)} {_num(value)}"
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, fn, **labels):
+        """Read the value from ``fn()`` at scrape time."""
+        self._functions[self._key(labels)] = fn
+
+    def value(self, **labels):
+        key = self._key(labels)
+        fn = self._functions.get(key)
+        return fn() if fn is not None else self._values.get(key, 0)
+
+    def samples(self):
+        values = dict(self._values)
+        for key, fn in self._functions.items():
+            try:
+                values[key] = fn()
+            except Exception:
+                continue
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{self._fmt_labels(key)} {_num(value)}"
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, help_text, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _num(bound)
+                yield f"{self.name}_bucket{self._fmt_labels(key, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{self._fmt_labels(key)} {_num(series[-1])}"
+            yield f"{self.name}_count{self._fmt_labels(key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _num(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+async def start_metrics_server(host=None, port=None, registry=REGISTRY):
+    """Serve ``/metrics`` until the returned runner is cleaned up.
+
+    Binds ``$METRICS_PORT`` (or ``$PORT``, which the Procfile ``web:`` process
+    is given). Without ``$PORT`` it only listens on localhost.
+    """
+    if port is None:
+        port = int(os.getenv('METRICS_PORT') or os.getenv('PORT') or 9108)
+    if host is None:
+        host = os.getenv('METRICS_HOST') or ('0.0.0.0' if os.getenv('PORT') else '127.0.0.1')
+
+    async def metrics(request):
+        return web.Response(
+            body=registry.render().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        )
+
+    async def health(request):
+        return web.Response(text='ok\n')
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/', health)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,212 @@
+"""Batched message deletion for channel moderation and ``!clean``.
+
+``ModerationQueue.submit`` collects messages to delete per channel and a
+worker per channel removes them with as few requests as possible (a worker
+left idle for ``idle_timeout`` seconds exits and drops its queue):
+
+- Messages younger than 14 days go through bulk delete, up to 100 per call.
+- Older messages are deleted one by one, because Discord rejects them in
+  bulk deletes.
+
+``purge`` streams a channel's history newest first and deletes it in the same
+batches. After every batch it saves the oldest message it reached to the
+journal's meta table, so an interrupted purge (a restart, ``!clean stop``)
+picks up there instead of rescanning the channel.
+
+Every request first takes a token from the shared ``TokenBucket`` at
+moderation priority, which keeps some budget back for alert delivery.
+"""
+import asyncio
+import logging
+import time
+
+import discord
+
+from metrics import Counter, Gauge
+from ratelimit import PRIORITY_MODERATION
+
+log = logging.getLogger('koru.moderation')
+
+MODERATION_DELETES = Counter('koru_moderation_deletes_total', "Messages deleted by moderation", ['method'])
+MODERATION_REQUESTS = Counter('koru_moderation_requests_total', "Delete requests sent to Discord", ['method'])
+MODERATION_DEPTH = Gauge('koru_moderation_queue_depth', "Messages waiting to be deleted")
+
+BULK_DELETE_MAX = 100
+# Discord only bulk-deletes messages younger than 14 days; keep a minute of slack
+BULK_DELETE_MAX_AGE = 14 * 24 * 3600 - 60
+
+
+def bulk_deletable(message, now=None):
+    created = discord.utils.snowflake_time(message.id).timestamp()
+    return (now or time.time()) - created < BULK_DELETE_MAX_AGE
+
+
+class ModerationQueue:
+    def __init__(self, budget, journal=None, linger=0.5, idle_timeout=60.0):
+        """``linger`` is how long a worker waits for more messages before deleting a batch."""
+        MODERATION_DEPTH.set_function(self.total_depth)
+        self.budget = budget
+        self.journal = journal
+        self.linger = linger
+        self.idle_timeout = idle_timeout
+        self._queues = {}   # channel id -> asyncio.Queue of messages
+        self._workers = {}  # channel id -> asyncio.Task
+        self._purges = {}   # channel id -> asyncio.Task
+
+    def submit(self, message):
+        """Queue ``message`` for deletion without waiting."""
+        if message.guild is None:
+            # The bot can't delete other users' DM messages; every attempt would be Forbidden
+            return
+        channel = message.channel
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = asyncio.Queue()
+        task = self._workers.get(channel.id)
+        if task is None or task.done():
+            self._workers[channel.id] = asyncio.create_task(self._worker(channel, queue))
+        queue.put_nowait(message)
+
+    def total_depth(self):
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    async def join(self):
+        await asyncio.gather(*(queue.join() for queue in self._queues.values()))
+
+    async def close(self):
+        tasks = list(self._workers.values()) + list(self._purges.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers.clear()
+        self._purges.clear()
+
+    async def _worker(self, channel, queue):
+        while True:
+            try:
+                first = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                if not queue.empty():
+                    continue
+                # Nothing was awaited since the check, so no message can slip in before the queue is dropped
+                del self._queues[channel.id]
+                del self._workers[channel.id]
+                return
+            batch = [first]
+            # A raid arrives as a stream; give it a moment so one bulk delete covers many
+            await asyncio.sleep(self.linger)
+            while len(batch) < BULK_DELETE_MAX and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self.delete(channel, batch)
+            except Exception as e:
+                log.error("moderation delete failed", extra={'channel': channel.id, 'messages': len(batch), 'error': str(e)})
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def delete(self, channel, messages):
+        """Delete ``messages`` from ``channel`` with bulk deletes where allowed. Returns the count deleted."""
+        now = time.time()
+        if hasattr(channel, 'delete_messages'):
+            recent = [m for m in messages if bulk_deletable(m, now)]
+            old = [m for m in messages if not bulk_deletable(m, now)]
+        else:
+            # DMs have no bulk delete
+            recent, old = [], list(messages)
+        deleted = 0
+        for start in range(0, len(recent), BULK_DELETE_MAX):
+            chunk = recent[start:start + BULK_DELETE_MAX]
+            if len(chunk) == 1:
+                # Bulk delete needs at least two messages
+                old.append(chunk[0])
+                continue
+            await self.budget.acquire(priority=PRIORITY_MODERATION)
+            MODERATION_REQUESTS.inc(method='bulk')
+            try:
+                await channel.delete_messages(chunk)
+            except discord.HTTPException as e:
+                # One message already gone (or too old by now) fails the whole call; fall back to one by one
+                log.warning("bulk delete failed, deleting one by one",
+                            extra={'channel': channel.id, 'messages': len(chunk), 'status': e.status, 'error': str(e)})
+                old.extend(chunk)
+                continue
+            MODERATION_DELETES.inc(len(chunk), method='bulk')
+            deleted += len(chunk)
+        for message in old:
+            await self.budget.acquire(priority=PRIORITY_MODERATION)
+            MODERATION_REQUESTS.inc(method='single')
+            try:
+                await message.delete()
+            except discord.NotFound:
+                continue
+            except discord.HTTPException as e:
+                log.warning("delete failed", extra={'channel': channel.id, 'message_id': message.id, 'status': e.status, 'error': str(e)})
+                continue
+            MODERATION_DELETES.inc(method='single')
+            deleted += 1
+        return deleted
+
+    def purging(self, channel_id):
+        task = self._purges.get(channel_id)
+        return task is not None and not task.done()
+
+    def cancel_purge(self, channel_id):
+        """Stop a running purge; its cursor is kept so it can be resumed."""
+        task = self._purges.get(channel_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def purge(self, channel, check=None, progress=None, resume=True):
+        """Start deleting every message in ``channel`` that passes ``check``.
+
+        ``progress(state)`` is awaited after every batch with a dict holding
+        ``scanned``, ``deleted`` and ``done``. Returns the purge task; the
+        task's result is the final state.
+        """
+        if self.purging(channel.id):
+            raise RuntimeError(f"a purge is already running in channel {channel.id}")
+        task = asyncio.create_task(self._purge(channel, check, progress, resume))
+        self._purges[channel.id] = task
+        return task
+
+    def saved_purge(self, channel_id):
+        """The saved state of an interrupted purge in ``channel_id``, or None."""
+        if self.journal is None:
+            return None
+        return self.journal.get_meta(f"purge:{channel_id}")
+
+    async def _purge(self, channel, check, progress, resume):
+        key = f"purge:{channel.id}"
+        state = (self.saved_purge(channel.id) if resume else None) or {'cursor': None, 'scanned': 0, 'deleted': 0}
+        state['done'] = False
+        before = discord.Object(id=state['cursor']) if state['cursor'] else None
+        log.info("purge started", extra={'channel': channel.id, 'resumed_from': state['cursor']})
+        batch = []
+
+        async def flush():
+            if batch:
+                state['deleted'] += await self.delete(channel, batch)
+                batch.clear()
+            if self.journal is not None:
+                self.journal.set_meta(key, {k: state[k] for k in ('cursor', 'scanned', 'deleted')})
+            if progress is not None:
+                await progress(dict(state))
+
+        async for message in channel.history(limit=None, before=before):
+            state['scanned'] += 1
+            state['cursor'] = message.id
+            if check is None or check(message):
+                batch.append(message)
+            if len(batch) >= BULK_DELETE_MAX:
+                await flush()
+        await flush()
+        state['done'] = True
+        if self.journal is not None:
+            self.journal.set_meta(key, None)
+        if progress is not None:
+            await progress(dict(state))
+        log.info("purge finished", extra={'channel': channel.id, 'scanned': state['scanned'], 'deleted': state['deleted']})
+        return state
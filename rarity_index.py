@@ -0,0 +1,202 @@
+"""Array-backed rarity index keyed by integer NFT number.
+
+Rank, percentile, tier code and score live in flat columns indexed by NFT
+number, with two precomputed orderings for range queries: by rank, and by
+(tier, rank). The index can be compiled to a small binary file that is
+memory-mapped at startup instead of parsing ``rarity-ranking.json``::
+
+    python rarity_index.py build [rarity-ranking.json] [rarity-ranking.bin]
+"""
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+# Rarest first, so a tier range like "Epic and rarer" is a contiguous slice
+TIERS = ("Mythic", "Legendary", "Epic", "Rare", "Common")
+TIER_CODES = {tier: code for code, tier in enumerate(TIERS)}
+NO_TIER = 255
+
+log = logging.getLogger('koru.rarity')
+
+RarityEntry = namedtuple('RarityEntry', ['number', 'rank', 'percentile', 'tier', 'score'])
+
+_MAGIC = b'KRIX'
+_VERSION = 1
+# magic, version, slots (max number + 1), entries, crc32 of the source JSON
+_HEADER = struct.Struct('<4sHxxIII')
+
+
+def _align8(offset):
+    return (offset + 7) & ~7
+
+
+class RarityIndex:
+    def __init__(self, ranks, percentiles, tiers, scores, by_rank, by_tier, tier_offsets,
+                 source_crc=0, _mmap=None):
+        self._rank = ranks
+        self._percentile = percentiles
+        self._tier = tiers
+        self._score = scores
+        self._by_rank = by_rank          # NFT numbers ordered by rank
+        self._by_tier = by_tier          # NFT numbers ordered by (tier code, rank)
+        self._tier_offsets = tier_offsets  # start of each tier in _by_tier, plus end
+        self.source_crc = source_crc
+        self._mmap = _mmap
+
+    @classmethod
+    def from_mapping(cls, data):
+        """Build from the ``{"1234": {"rank": ..., ...}}`` layout of rarity-ranking.json."""
+        slots = max((int(k) for k in data), default=-1) + 1
+        ranks = array('i', [0]) * slots
+        percentiles = array('f', [0.0]) * slots
+        tiers = array('B', [NO_TIER]) * slots
+        scores = array('d', [0.0]) * slots
+        for key, info in data.items():
+            number = int(key)
+            ranks[number] = int(info.get('rank') or 0)
+            percentiles[number] = float(info.get('percentile') or 0.0)
+            tiers[number] = TIER_CODES.get(info.get('tier'), NO_TIER)
+            scores[number] = float(info.get('score') or 0.0)
+        numbers = [int(k) for k in data]
+        by_rank = array('i', sorted(numbers, key=lambda n: ranks[n]))
+        by_tier = array('i', sorted(numbers, key=lambda n: (tiers[n], ranks[n])))
+        tier_offsets = array('I', [0]) * (len(TIERS) + 1)
+        codes = [tiers[n] for n in by_tier]
+        for code in range(len(TIERS) + 1):
+            tier_offsets[code] = bisect_left(codes, code)
+        return cls(ranks, percentiles, tiers, scores, by_rank, by_tier, tier_offsets)
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            import orjson
+            data = orjson.loads(raw)
+        except ImportError:
+            import json
+            data = json.loads(raw)
+        index = cls.from_mapping(data)
+        index.source_crc = zlib.crc32(raw)
+        return index
+
+    @classmethod
+    def from_binary(cls, path):
+        """Memory-map a file written by ``write_binary``."""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, slots, entries, source_crc = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            mm.close()
+            raise ValueError(f"{path} is not a version {_VERSION} rarity index")
+        view = memoryview(mm)
+        columns = []
+        offset = _align8(_HEADER.size)
+        for fmt, count in (('i', slots), ('f', slots), ('B', slots), ('d', slots),
+                           ('i', entries), ('i', entries), ('I', len(TIERS) + 1)):
+            size = struct.calcsize(fmt) * count
+            columns.append(view[offset:offset + size].cast(fmt))
+            offset = _align8(offset + size)
+        return cls(*columns, source_crc=source_crc, _mmap=mm)
+
+    def write_binary(self, path):
+        columns = (self._rank, self._percentile, self._tier, self._score,
+                   self._by_rank, self._by_tier, self._tier_offsets)
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(self._rank), len(self._by_rank), self.source_crc))
+            offset = _HEADER.size
+            for column in columns:
+                padding = _align8(offset) - offset
+                f.write(b'\0' * padding)
+                raw = column.tobytes() if isinstance(column, array) else bytes(column)
+                f.write(raw)
+                offset += padding + len(raw)
+
+    def close(self):
+        if self._mmap is not None:
+            # Release the memoryviews before closing the map they point into
+            for name in ('_rank', '_percentile', '_tier', '_score', '_by_rank', '_by_tier', '_tier_offsets'):
+                getattr(self, name).release()
+            self._mmap.close()
+            self._mmap = None
+
+    def __len__(self):
+        return len(self._by_rank)
+
+    def __contains__(self, number):
+        return 0 <= number < len(self._rank) and self._rank[number] > 0
+
+    def get(self, number):
+        """Rarity for NFT ``number`` (int), or None if it is not ranked."""
+        if number is None or number not in self:
+            return None
+        return self._entry(number)
+
+    def rank_range(self, lo, hi):
+        """Entries with ``lo <= rank <= hi``, rarest first."""
+        ranks = self._rank
+        start = bisect_left(self._by_rank, lo, key=lambda n: ranks[n])
+        end = bisect_right(self._by_rank, hi, key=lambda n: ranks[n])
+        return [self._entry(n) for n in self._by_rank[start:end]]
+
+    def tier_range(self, rarest, commonest=None):
+        """Entries from tier ``rarest`` through ``commonest`` (inclusive), rarest first.
+
+        ``tier_range("Mythic")`` is every Mythic; ``tier_range("Mythic", "Epic")``
+        is every Epic or rarer.
+        """
+        first = TIER_CODES[rarest]
+        last = TIER_CODES[commonest or rarest]
+        start, end = self._tier_offsets[first], self._tier_offsets[last + 1]
+        return [self._entry(n) for n in self._by_tier[start:end]]
+
+    def _entry(self, number):
+        tier = self._tier[number]
+        return RarityEntry(
+            number,
+            self._rank[number],
+            round(self._percentile[number], 2),
+            TIERS[tier] if tier != NO_TIER else 'Unknown',
+            self._score[number],
+        )
+
+
+def load_rarity_index(json_path):
+    """Load the index, preferring the compiled ``.bin`` next to ``json_path``.
+
+    The binary is only used if it was built from the current JSON (same
+    CRC32), so a stale ``.bin`` never shadows an updated ranking.
+    """
+    bin_path = os.path.splitext(json_path)[0] + '.bin'
+    if os.path.exists(bin_path):
+        try:
+            index = RarityIndex.from_binary(bin_path)
+        except (OSError, ValueError) as e:
+            log.error("could not map rarity index, falling back to JSON", extra={'path': bin_path, 'error': str(e)})
+        else:
+            if not os.path.exists(json_path):
+                return index
+            with open(json_path, 'rb') as f:
+                if index.source_crc == zlib.crc32(f.read()):
+                    return index
+            index.close()
+            log.info("rarity index is out of date; loading JSON", extra={'path': bin_path})
+    return RarityIndex.from_json(json_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print("usage: python rarity_index.py build [rarity-ranking.json] [rarity-ranking.bin]")
+        sys.exit(2)
+    here = os.path.dirname(os.path.abspath(__file__))
+    src = sys.argv[2] if len(sys.argv) > 2 else os.path.join(here, 'rarity-ranking.json')
+    dst = sys.argv[3] if len(sys.argv) > 3 else os.path.splitext(src)[0] + '.bin'
+    index = RarityIndex.from_json(src)
+    index.write_binary(dst)
+    print(f"Wrote {len(index)} entries to {dst} ({os.path.getsize(dst)} bytes).")
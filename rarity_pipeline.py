@@ -0,0 +1,270 @@
+"""Offline rarity scoring pipeline that regenerates rarity-ranking.json.
+
+Takes a dump of collection trait metadata, computes trait frequencies with
+NumPy, scores every token with a pluggable method, then assigns ranks,
+percentiles and tiers. Requires numpy.
+
+Accepted trait dumps:
+
+- ``{"1234": {"Background": "Blue", "Eyes": "Laser"}, ...}``
+- a list of Magic Eden token objects with ``name`` ("Koru #1234") and
+  ``attributes`` (``[{"trait_type": ..., "value": ...}]``)
+
+Usage::
+
+    python rarity_pipeline.py score traits.json [-o rarity-ranking.json] [--method trait_product] [--bin]
+    python rarity_pipeline.py bench [--items 10000 100000] [--trait-types 8]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from metadata_cache import parse_nft_number
+
+MISSING_TRAIT = "None"
+
+# (tier, highest percentile in the tier); matches the cutoffs in rarity-ranking.json
+TIER_CUTOFFS = (
+    ("Mythic", 1.0),
+    ("Legendary", 5.0),
+    ("Epic", 15.0),
+    ("Rare", 35.0),
+    ("Common", 100.0),
+)
+
+SCORERS = {}
+
+
+def scorer(name, rarer_is_higher, local=True):
+    """Register a scoring method.
+
+    The function receives the ``(items, trait_types)`` frequency matrix and
+    the model, and returns one score per row. ``local`` scorers depend only on
+    a token's own trait frequencies, so incremental updates only rescore the
+    tokens that share a changed trait value.
+    """
+    def register(fn):
+        fn.rarer_is_higher = rarer_is_higher
+        fn.local = local
+        SCORERS[name] = fn
+        return fn
+    return register
+
+
+@scorer("trait_product", rarer_is_higher=False)
+def trait_product(freqs, model):
+    """Product of trait frequencies, i.e. statistical rarity (the score stored in rarity-ranking.json)."""
+    return np.prod(freqs, axis=1)
+
+
+@scorer("rarity_score", rarer_is_higher=True)
+def rarity_score(freqs, model):
+    """Sum of inverse trait frequencies ("rarity score")."""
+    return np.sum(1.0 / freqs, axis=1)
+
+
+@scorer("information_content", rarer_is_higher=True, local=False)
+def information_content(freqs, model):
+    """Information content of a token's traits, normalised by collection entropy."""
+    entropy = model.collection_entropy()
+    ic = np.sum(-np.log2(freqs), axis=1)
+    return ic / entropy if entropy > 0 else ic
+
+
+def _trait_value(value):
+    return MISSING_TRAIT if value is None else str(value)
+
+
+def load_traits(path):
+    """Read a trait dump and return ``{number: {trait_type: value}}``."""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return {int(number): dict(traits) for number, traits in data.items()}
+    traits_by_number = {}
+    for token in data:
+        number = parse_nft_number(token.get('name'))
+        if number is None:
+            continue
+        traits_by_number[number] = {
+            attr.get('trait_type'): attr.get('value') for attr in token.get('attributes') or []
+        }
+    return traits_by_number
+
+
+class RarityModel:
+    """Encoded trait matrix plus per-value counts for one collection."""
+
+    def __init__(self, traits_by_number, method="trait_product"):
+        self.method = SCORERS[method]
+        self.numbers = np.array(sorted(traits_by_number), dtype=np.int64)
+        self._row = {int(n): i for i, n in enumerate(self.numbers)}
+        self.trait_types = sorted({t for traits in traits_by_number.values() for t in traits})
+        self._values = []  # per type: value -> code
+        self.codes = np.empty((len(self.numbers), len(self.trait_types)), dtype=np.int32)
+        rows = [traits_by_number[int(number)] for number in self.numbers]
+        for t, trait_type in enumerate(self.trait_types):
+            column = np.array([_trait_value(traits.get(trait_type)) for traits in rows])
+            values, self.codes[:, t] = np.unique(column, return_inverse=True)
+            self._values.append({str(value): code for code, value in enumerate(values)})
+        self.counts = [
+            np.bincount(self.codes[:, t], minlength=len(self._values[t])).astype(np.int64)
+            for t in range(len(self.trait_types))
+        ]
+        self.scores = self.method(self._freqs(), self)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def collection_entropy(self):
+        n = len(self.numbers)
+        total = 0.0
+        for counts in self.counts:
+            p = counts[counts > 0] / n
+            total += float(-(p * np.log2(p)).sum())
+        return total
+
+    def update(self, changed):
+        """Apply ``{number: traits}`` for tokens whose traits changed and rescore.
+
+        Only tokens sharing a trait value whose count moved are rescored
+        (all tokens for non-local methods). Returns the number rescored.
+        """
+        touched = [set() for _ in self.trait_types]
+        for number, traits in changed.items():
+            row = self._row[int(number)]
+            new_codes = self._encode(traits)
+            for t, (old, new) in enumerate(zip(self.codes[row], new_codes)):
+                if old == new:
+                    continue
+                if new >= len(self.counts[t]):
+                    self.counts[t] = np.concatenate(
+                        [self.counts[t], np.zeros(new + 1 - len(self.counts[t]), dtype=np.int64)]
+                    )
+                self.counts[t][old] -= 1
+                self.counts[t][new] += 1
+                touched[t].update((int(old), int(new)))
+            self.codes[row] = new_codes
+        if not self.method.local:
+            self.scores = self.method(self._freqs(), self)
+            return len(self.numbers)
+        mask = np.zeros(len(self.numbers), dtype=bool)
+        for t, values in enumerate(touched):
+            if values:
+                mask |= np.isin(self.codes[:, t], list(values))
+        rows = np.flatnonzero(mask)
+        if len(rows):
+            self.scores[rows] = self.method(self._freqs(rows), self)
+        return len(rows)
+
+    def rankings(self, cutoffs=TIER_CUTOFFS):
+        """Return ``(ranks, percentiles, tier_names)`` aligned with ``self.numbers``."""
+        n = len(self.numbers)
+        keys = -self.scores if self.method.rarer_is_higher else self.scores
+        # Ties are broken by NFT number so output is deterministic
+        order = np.lexsort((self.numbers, keys))
+        ranks = np.empty(n, dtype=np.int64)
+        ranks[order] = np.arange(1, n + 1)
+        percentiles = ranks * 100.0 / n
+        bounds = np.array([limit for _, limit in cutoffs])
+        tier_idx = np.minimum(np.searchsorted(bounds, percentiles, side='left'), len(cutoffs) - 1)
+        tier_names = np.array([tier for tier, _ in cutoffs])[tier_idx]
+        return ranks, percentiles, tier_names
+
+    def to_ranking(self, cutoffs=TIER_CUTOFFS):
+        """Build the ``rarity-ranking.json`` mapping."""
+        ranks, percentiles, tiers = self.rankings(cutoffs)
+        return {
+            str(int(number)): {
+                "rank": int(rank),
+                "percentile": round(float(pct), 2),
+                "tier": str(tier),
+                "score": float(f"{score:.7g}"),
+            }
+            for number, rank, pct, tier, score in zip(self.numbers, ranks, percentiles, tiers, self.scores)
+        }
+
+    def _encode(self, traits):
+        codes = np.empty(len(self.trait_types), dtype=np.int32)
+        for t, trait_type in enumerate(self.trait_types):
+            codes[t] = self._values[t].setdefault(_trait_value(traits.get(trait_type)), len(self._values[t]))
+        return codes
+
+    def _freqs(self, rows=None):
+        codes = self.codes if rows is None else self.codes[rows]
+        n = len(self.numbers)
+        return np.column_stack([self.counts[t][codes[:, t]] / n for t in range(len(self.trait_types))])
+
+
+def synthetic_traits(items, trait_types=8, seed=7):
+    """Random collection with Zipf-ish value frequencies, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    columns = []
+    for t in range(trait_types):
+        n_values = int(rng.integers(5, 40))
+        weights = 1.0 / np.arange(1, n_values + 1) ** 1.1
+        columns.append(rng.choice(n_values, size=items, p=weights / weights.sum()))
+    return {
+        number: {f"type{t}": f"v{columns[t][number - 1]}" for t in range(trait_types)}
+        for number in range(1, items + 1)
+    }
+
+
+def bench(sizes, trait_types, methods, changes=10):
+    for items in sizes:
+        traits = synthetic_traits(items, trait_types)
+        for method in methods:
+            start = time.perf_counter()
+            model = RarityModel(traits, method)
+            built = time.perf_counter()
+            model.rankings()
+            ranked = time.perf_counter()
+            rng = np.random.default_rng(items)
+            changed = {
+                int(number): {**traits[int(number)], "type0": "v0"}
+                for number in rng.choice(model.numbers, size=changes, replace=False)
+            }
+            rescored = model.update(changed)
+            model.rankings()
+            updated = time.perf_counter()
+            print(
+                f"{items:>7} items  {method:<20} encode+score {1000 * (built - start):8.1f} ms"
+                f"  rank {1000 * (ranked - built):6.1f} ms"
+                f"  update {changes} ({rescored} rescored) {1000 * (updated - ranked):7.1f} ms"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate rarity-ranking.json from trait metadata.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    score_cmd = sub.add_parser('score', help="score a trait dump and write the ranking")
+    score_cmd.add_argument('traits')
+    score_cmd.add_argument('-o', '--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rarity-ranking.json'))
+    score_cmd.add_argument('--method', choices=sorted(SCORERS), default='trait_product')
+    score_cmd.add_argument('--bin', action='store_true', help="also rebuild the memory-mapped .bin index")
+    bench_cmd = sub.add_parser('bench', help="time the pipeline on synthetic collections")
+    bench_cmd.add_argument('--items', type=int, nargs='+', default=[10_000, 100_000])
+    bench_cmd.add_argument('--trait-types', type=int, default=8)
+    bench_cmd.add_argument('--method', choices=sorted(SCORERS), nargs='+', default=sorted(SCORERS))
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        bench(args.items, args.trait_types, args.method)
+        return
+    model = RarityModel(load_traits(args.traits), args.method)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(model.to_ranking(), f, indent=2)
+    print(f"Wrote {len(model)} rankings to {args.output} using {args.method}.")
+    if args.bin:
+        from rarity_index import RarityIndex
+        bin_path = os.path.splitext(args.output)[0] + '.bin'
+        RarityIndex.from_json(args.output).write_binary(bin_path)
+        print(f"Wrote {bin_path}.")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Shared request budget with priorities.
+
+Discord enforces a global per-bot request limit on top of its per-route
+buckets. discord.py waits out the per-route buckets itself, but it has no idea
+which of our requests matter more. ``TokenBucket`` is the bot's own budget:
+every caller awaits ``acquire`` before a request. Waiters are served strictly
+by priority (then arrival), and low-priority callers may not dip into the
+last ``reserve`` tokens. A moderation sweep therefore never delays an alert.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+# Lower numbers are served first
+PRIORITY_ALERT = 0
+PRIORITY_MODERATION = 10
+# Anything else that can wait behind alerts
+PRIORITY_BACKGROUND = PRIORITY_MODERATION
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, reserve=0):
+        """Refill ``rate`` tokens per second up to ``capacity``.
+
+        Callers with a priority above ``PRIORITY_ALERT`` must leave ``reserve``
+        tokens in the bucket.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.reserve = float(reserve)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiters = []  # heap of [priority, seq, tokens, future]
+        self._seq = itertools.count()
+
+    @property
+    def available(self):
+        self._refill()
+        return self._tokens
+
+    def try_acquire(self, tokens=1, priority=PRIORITY_ALERT):
+        """Take ``tokens`` if that is possible right now without queueing."""
+        self._refill()
+        if self._waiters or self._tokens - tokens < self._floor(priority):
+            return False
+        self._tokens -= tokens
+        return True
+
+    async def acquire(self, tokens=1, priority=PRIORITY_ALERT):
+        """Wait until ``tokens`` can be taken, behind any higher-priority waiter."""
+        if self.try_acquire(tokens, priority):
+            return
+        entry = [priority, next(self._seq), tokens, None]
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                if self._waiters[0] is entry:
+                    self._refill()
+                    deficit = tokens + self._floor(priority) - self._tokens
+                    if deficit <= 0:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= tokens
+                        return
+                    # The head sleeps until it can be served; a new, more urgent
+                    # waiter that arrives meanwhile takes over when it wakes
+                    await asyncio.sleep(deficit / self.rate)
+                else:
+                    entry[3] = asyncio.get_running_loop().create_future()
+                    await entry[3]
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            raise
+        finally:
+            self._wake_head()
+
+    def _floor(self, priority):
+        return 0.0 if priority <= PRIORITY_ALERT else self.reserve
+
+    def _wake_head(self):
+        if self._waiters:
+            future = self._waiters[0][3]
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
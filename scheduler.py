@@ -0,0 +1,53 @@
+import time
+from collections import deque
+
+
+class AdaptiveInterval:
+    """Poll interval that tightens while events are flowing and backs off when idle.
+
+    Each tick reports how many new events it found. A hit multiplies the
+    interval by ``speedup`` (< 1), an empty tick multiplies it by ``backoff``
+    (> 1), and the result is clamped to ``[min_seconds, max_seconds]``.
+    """
+
+    def __init__(self, min_seconds=15.0, max_seconds=300.0, initial_seconds=120.0,
+                 speedup=0.5, backoff=1.5, window=20):
+        if not 0 < min_seconds <= max_seconds:
+            raise ValueError("need 0 < min_seconds <= max_seconds")
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.speedup = speedup
+        self.backoff = backoff
+        self.interval = min(max(initial_seconds, min_seconds), max_seconds)
+        # (monotonic time, events found) for the last ``window`` ticks
+        self._history = deque(maxlen=window)
+
+    def record(self, events_found):
+        """Record one tick and return the interval to wait before the next."""
+        self._history.append((time.monotonic(), events_found))
+        factor = self.speedup if events_found else self.backoff
+        self.interval = min(max(self.interval * factor, self.min_seconds), self.max_seconds)
+        return self.interval
+
+    @property
+    def hit_rate(self):
+        """Fraction of recent ticks that found at least one new event."""
+        if not self._history:
+            return 0.0
+        return sum(1 for _, found in self._history if found) / len(self._history)
+
+    @property
+    def events_per_minute(self):
+        """New events per minute over the recent window."""
+        if len(self._history) < 2:
+            return 0.0
+        span = self._history[-1][0] - self._history[0][0]
+        if span <= 0:
+            return 0.0
+        # The first tick's events arrived before the window started
+        return sum(found for _, found in list(self._history)[1:]) * 60.0 / span
+
+    def describe(self):
+        return (f"interval {self.interval:.0f}s (bounds {self.min_seconds:.0f}-{self.max_seconds:.0f}s), "
+                f"hit rate {self.hit_rate:.0%} over {len(self._history)} ticks, "
+                f"{self.events_per_minute:.1f} events/min")
@@ -0,0 +1,376 @@
+"""Push-based ingestion from a Solana RPC websocket.
+
+REST polling puts a floor under alert latency, and it uses most of the Magic
+Eden request budget. ``LogStream`` instead subscribes (``logsSubscribe``) to
+the logs of the Magic Eden marketplace program and turns every listing and
+sale of a tracked mint into an activity shaped like the REST ones. It hands
+that activity to the same tracker pipeline within a fraction of a second.
+
+The logs name the instruction and the price but not the NFT. A listing or
+sale is therefore resolved with one ``getTransaction`` call against the HTTP
+RPC, paced by its own token bucket. It is then matched against the
+collections' hashlists (``hashlist_file`` in ``collections.json``); trades of
+other collections are dropped.
+
+The stream is a fast path, not the source of truth. REST polling keeps
+running and finds nothing new while the stream is healthy, so its adaptive
+interval backs off to the maximum. Events may be missed when:
+
+- the socket drops or goes silent for ``idle_timeout`` seconds,
+- a frame cannot be parsed,
+- the decode backlog overflows,
+- or a transaction cannot be fetched.
+
+In all of these cases ``on_gap`` is called. The bot then polls every
+collection right away (``TrackerPool.catch_up``), and the journal drops
+whatever both paths saw. The socket reconnects with jittered exponential
+backoff.
+
+Enable it with ``SOLANA_WS_URL`` (and ``SOLANA_RPC_URL`` when the HTTP
+endpoint is not the same URL over http(s)).
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+
+import aiohttp
+
+from governor import backoff_delay
+from me_client import loads_json
+from metrics import Counter, Gauge, Histogram
+from ratelimit import TokenBucket
+from stats_cache import LAMPORTS_PER_SOL
+
+log = logging.getLogger('koru.stream')
+
+# Magic Eden marketplace program (M2)
+M2_PROGRAM_ID = 'M2mx93ekt1fmXSVkTrUL9xVFHkmME8HTUi5Cyc5aF7K'
+# Anchor logs "Instruction: <Name>" for every instruction the program runs.
+# A buy-now runs a bid (BuyV2) and the sale in one transaction; the sale wins
+LIST_INSTRUCTIONS = {'Sell', 'Mip1Sell', 'OcpSell', 'CoreSell'}
+SALE_INSTRUCTIONS = {'ExecuteSaleV2', 'Mip1ExecuteSaleV2', 'OcpExecuteSaleV2', 'CoreExecuteSaleV2'}
+
+_INSTRUCTION = re.compile(r'^Program log: Instruction: (\w+)$')
+# M2 logs the trade's arguments as JSON, e.g. {"price":1500000000,"seller_expiry":-1}
+_PRICE = re.compile(r'"price":\s*(\d+)')
+
+STREAM_CONNECTED = Gauge('koru_stream_connected', "1 while the Solana log subscription is live")
+STREAM_EVENTS = Counter('koru_stream_events_total', "Tracked listings and sales decoded from the log stream",
+                        ['type'])
+STREAM_SKIPPED = Counter('koru_stream_skipped_total', "Marketplace trades dropped by the log stream", ['reason'])
+STREAM_GAPS = Counter('koru_stream_gaps_total', "Times the log stream may have missed events", ['reason'])
+STREAM_LATENCY = Histogram('koru_stream_decode_seconds', "Log notification received to activity handed over",
+                           buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+STREAM_BACKLOG = Gauge('koru_stream_backlog', "Log notifications waiting for getTransaction")
+
+
+def http_url(ws_url):
+    """The HTTP RPC endpoint that usually sits behind a websocket one."""
+    if ws_url.startswith('wss://'):
+        return 'https://' + ws_url[len('wss://'):]
+    if ws_url.startswith('ws://'):
+        return 'http://' + ws_url[len('ws://'):]
+    return ws_url
+
+
+def load_mint_index(configs):
+    """mint -> collection slug from every config's ``hashlist_file``."""
+    index = {}
+    for config in configs:
+        if not config.hashlist_file:
+            continue
+        try:
+            with open(config.hashlist_file, 'r', encoding='utf-8') as f:
+                mints = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("could not load hashlist", extra={'collection': config.slug, 'error': str(e)})
+            continue
+        for mint in mints:
+            index[mint] = config.slug
+    return index
+
+
+def classify(logs):
+    """``'buyNow'``, ``'list'`` or None for one transaction's log lines."""
+    kind = None
+    for line in logs:
+        match = _INSTRUCTION.match(line)
+        if match is None:
+            continue
+        name = match.group(1)
+        if name in SALE_INSTRUCTIONS:
+            return 'buyNow'
+        if name in LIST_INSTRUCTIONS:
+            kind = 'list'
+    return kind
+
+
+def log_price(logs):
+    """Trade price in SOL from the program's argument log, or None."""
+    for line in logs:
+        match = _PRICE.search(line)
+        if match:
+            return int(match.group(1)) / LAMPORTS_PER_SOL
+    return None
+
+
+def _nft_owners(balances):
+    """mint -> owner for every balance holding exactly one zero-decimal token."""
+    owners = {}
+    for balance in balances or ():
+        amount = balance.get('uiTokenAmount') or {}
+        if amount.get('decimals') == 0 and amount.get('amount') == '1':
+            owners[balance.get('mint')] = balance.get('owner')
+    return owners
+
+
+def _signer(tx):
+    keys = ((tx.get('transaction') or {}).get('message') or {}).get('accountKeys') or ()
+    for key in keys:
+        # jsonParsed keys are objects; other encodings list the fee payer (a signer) first
+        if isinstance(key, dict):
+            if key.get('signer'):
+                return key.get('pubkey')
+        else:
+            return key
+    return None
+
+
+def decode_transaction(tx, signature, kind, mints, logs=()):
+    """Activity for a fetched marketplace transaction, or None if it trades no mint in ``mints``.
+
+    The result has the fields the tracker reads from REST activities:
+    ``signature``, ``type``, ``tokenMint``, ``collection``, ``blockTime``,
+    ``slot``, ``price`` (SOL), ``seller`` and ``buyer``.
+    """
+    meta = tx.get('meta') or {}
+    if meta.get('err') is not None:
+        return None
+    before = _nft_owners(meta.get('preTokenBalances'))
+    after = _nft_owners(meta.get('postTokenBalances'))
+    mint = next((m for m in (*after, *before) if m in mints), None)
+    if mint is None:
+        return None
+    signer = _signer(tx)
+    if kind == 'buyNow':
+        seller, buyer = before.get(mint), after.get(mint) or signer or 'Unknown'
+    else:
+        seller, buyer = before.get(mint) or after.get(mint) or signer, None
+    item = {
+        'signature': signature,
+        'type': kind,
+        'source': 'solana_stream',
+        'tokenMint': mint,
+        'collection': mints[mint],
+        'slot': tx.get('slot'),
+        'blockTime': tx.get('blockTime') or int(time.time()),
+        'seller': seller or 'Unknown',
+        'buyer': buyer,
+    }
+    price = log_price(logs or meta.get('logMessages') or ())
+    if price is not None:
+        item['price'] = price
+    return item
+
+
+class LogStream:
+    def __init__(self, ws_url, rpc_url, mints, on_events, on_gap, program_id=M2_PROGRAM_ID,
+                 rpc_rate=10.0, workers=4, max_backlog=1000, idle_timeout=60.0,
+                 base_delay=0.5, max_delay=30.0, gap_cooldown=5.0):
+        """``mints`` maps mint -> collection slug.
+
+        ``on_events(slug, items)`` is awaited with decoded activities and
+        ``on_gap(reason)`` is called whenever events may have been missed.
+        ``idle_timeout`` is how long a subscription may stay silent before it
+        is treated as dead; the marketplace trades every few seconds.
+        ``gap_cooldown`` spaces out the catch-ups for per-event gaps.
+        """
+        self.ws_url = ws_url
+        self.rpc_url = rpc_url
+        self.mints = mints
+        self.on_events = on_events
+        self.on_gap = on_gap
+        self.program_id = program_id
+        self.rpc_budget = TokenBucket(rpc_rate, capacity=max(rpc_rate, workers))
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.gap_cooldown = gap_cooldown
+        self.connected = False
+        self.last_slot = None
+        self._backlog = asyncio.Queue(maxsize=max_backlog)
+        self._last_gap = 0.0
+        self._session = None
+        self._tasks = []
+        STREAM_CONNECTED.set_function(lambda: int(self.connected))
+        STREAM_BACKLOG.set_function(self._backlog.qsize)
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10, connect=3))
+        self._tasks = [asyncio.create_task(self._run())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        for task in self._tasks:
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        # Both loops catch everything, so this is a bug; say so instead of going quiet
+        log.error("log stream task crashed", exc_info=task.exception())
+        if self.connected:
+            self.connected = False
+            self._gap('crashed')
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.connected = False
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _gap(self, reason):
+        STREAM_GAPS.inc(reason=reason)
+        now = time.monotonic()
+        # Per-event gaps can fire in runs; one catch-up covers the whole run
+        if reason in ('backlog', 'unresolved', 'malformed') and now - self._last_gap < self.gap_cooldown:
+            return
+        self._last_gap = now
+        log.warning("log stream gap; catching up over REST", extra={'reason': reason, 'slot': self.last_slot})
+        try:
+            self.on_gap(reason)
+        except Exception:
+            log.exception("gap handler failed")
+
+    def _backoff(self, attempt):
+        return backoff_delay(attempt, self.base_delay, self.max_delay)
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            reason = 'closed'
+            try:
+                await self._stream()
+            except asyncio.TimeoutError:
+                reason = 'idle'
+            except (aiohttp.ClientError, ConnectionError, ValueError) as e:
+                reason = 'error'
+                log.error("log stream failed", extra={'error': str(e) or type(e).__name__})
+            except Exception:
+                # Whatever it was, a dead stream must not look live: reconnect and catch up
+                reason = 'error'
+                log.exception("log stream failed")
+            if self.connected:
+                self.connected = False
+                attempt = 0
+                # Poll right away; the pool keeps every tracker at its fastest interval until we reconnect
+                self._gap(reason)
+            delay = self._backoff(attempt)
+            attempt += 1
+            log.info("log stream reconnecting", extra={'delay': round(delay, 2), 'reason': reason})
+            await asyncio.sleep(delay)
+
+    async def _stream(self):
+        async with self._session.ws_connect(self.ws_url, heartbeat=30) as ws:
+            await ws.send_str(json.dumps({
+                'jsonrpc': '2.0', 'id': 1, 'method': 'logsSubscribe',
+                'params': [{'mentions': [self.program_id]}, {'commitment': 'confirmed'}],
+            }))
+            while True:
+                message = await asyncio.wait_for(ws.receive(), self.idle_timeout)
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    if message.type == aiohttp.WSMsgType.ERROR:
+                        raise ws.exception() or aiohttp.ClientError("websocket error")
+                    return
+                try:
+                    payload = loads_json(message.data)
+                    if not isinstance(payload, dict):
+                        raise ValueError("not a JSON object")
+                    if payload.get('method') == 'logsNotification':
+                        self._on_logs(payload['params']['result'])
+                        continue
+                except (KeyError, TypeError, ValueError) as e:
+                    # One bad frame may be one lost event; catch up but keep the subscription
+                    STREAM_SKIPPED.inc(reason='malformed')
+                    log.warning("malformed log stream frame", extra={'error': str(e) or type(e).__name__})
+                    self._gap('malformed')
+                    continue
+                if payload.get('id') == 1:
+                    if 'error' in payload:
+                        raise ValueError(f"logsSubscribe failed: {payload['error']}")
+                    self.connected = True
+                    log.info("log stream subscribed", extra={'program': self.program_id,
+                                                             'subscription': payload.get('result')})
+                    # Whatever happened between the last poll and now is caught up over REST
+                    self._gap('subscribed')
+
+    def _on_logs(self, result):
+        value = result['value']
+        self.last_slot = max(self.last_slot or 0, result['context']['slot'])
+        if value.get('err') is not None:
+            return
+        logs = value.get('logs') or ()
+        kind = classify(logs)
+        if kind is None:
+            return
+        try:
+            self._backlog.put_nowait((value['signature'], kind, logs, time.perf_counter()))
+        except asyncio.QueueFull:
+            STREAM_SKIPPED.inc(reason='backlog')
+            self._gap('backlog')
+
+    async def _worker(self):
+        while True:
+            signature, kind, logs, received = await self._backlog.get()
+            try:
+                await self._resolve(signature, kind, logs, received)
+            except Exception:
+                log.exception("could not decode marketplace transaction", extra={'signature': signature})
+            finally:
+                self._backlog.task_done()
+
+    async def _resolve(self, signature, kind, logs, received):
+        tx = await self._get_transaction(signature)
+        if tx is None:
+            STREAM_SKIPPED.inc(reason='unresolved')
+            self._gap('unresolved')
+            return
+        item = decode_transaction(tx, signature, kind, self.mints, logs)
+        if item is None:
+            STREAM_SKIPPED.inc(reason='untracked')
+            return
+        STREAM_EVENTS.inc(type=kind)
+        STREAM_LATENCY.observe(time.perf_counter() - received)
+        await self.on_events(item['collection'], [item])
+
+    async def _get_transaction(self, signature, attempts=4):
+        """The parsed transaction, retried while the RPC node has not caught up to it yet."""
+        body = json.dumps({
+            'jsonrpc': '2.0', 'id': 1, 'method': 'getTransaction',
+            'params': [signature, {'encoding': 'jsonParsed', 'commitment': 'confirmed',
+                                   'maxSupportedTransactionVersion': 0}],
+        })
+        for attempt in range(attempts):
+            await self.rpc_budget.acquire()
+            try:
+                async with self._session.post(self.rpc_url, data=body,
+                                              headers={'Content-Type': 'application/json'}) as resp:
+                    if resp.status == 200:
+                        result = loads_json(await resp.read()).get('result')
+                        if result is not None:
+                            return result
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                log.debug("getTransaction failed", extra={'signature': signature, 'error': str(e)})
+            await asyncio.sleep(self._backoff(attempt) / 2)
+        return None
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+
+log = logging.getLogger('koru.stats')
+
+LAMPORTS_PER_SOL = 1_000_000_000
+
+
+class StatsCache:
+    """TTL cache for ``/v2/collections/{symbol}/stats``.
+
+    - Fresh entries (younger than ``ttl``) are returned as-is.
+    - Stale entries (younger than ``max_stale``) are returned immediately while a
+      single background refresh runs.
+    - Concurrent misses for the same symbol share one in-flight request.
+    """
+
+    def __init__(self, client, ttl=30.0, max_stale=600.0):
+        self.client = client
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = {}   # symbol -> (monotonic fetch time, stats dict, wall-clock fetch time)
+        self._inflight = {}  # symbol -> asyncio.Task
+
+    async def get(self, symbol):
+        """Return the stats dict for ``symbol``, fetching it only when needed."""
+        entry = self._entries.get(symbol)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                return entry[1]
+            if age < self.max_stale:
+                self._refresh(symbol)
+                return entry[1]
+        # Shield so one cancelled caller does not cancel the fetch for the others
+        return await asyncio.shield(self._refresh(symbol))
+
+    def peek(self, symbol):
+        """Return the cached stats for ``symbol`` without touching the API."""
+        entry = self._entries.get(symbol)
+        return entry[1] if entry is not None else None
+
+    def fetched_at(self, symbol):
+        """Wall-clock time the cached stats for ``symbol`` were fetched, or None."""
+        entry = self._entries.get(symbol)
+        return entry[2] if entry is not None else None
+
+    async def floor_sol(self, symbol):
+        """Floor price in SOL, or None if it is unknown or the fetch failed."""
+        try:
+            stats = await self.get(symbol)
+        except Exception:
+            # Already logged by _on_done; fall back to whatever we last saw
+            stats = self.peek(symbol)
+        return floor_sol_from_stats(stats)
+
+    def _refresh(self, symbol):
+        task = self._inflight.get(symbol)
+        if task is None:
+            task = asyncio.ensure_future(self._load(symbol))
+            self._inflight[symbol] = task
+            task.add_done_callback(lambda t: self._on_done(symbol, t))
+        return task
+
+    async def _load(self, symbol):
+        stats = await self.client.collection_stats(symbol)
+        self._entries[symbol] = (time.monotonic(), stats, time.time())
+        return stats
+
+    def _on_done(self, symbol, task):
+        self._inflight.pop(symbol, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Background refreshes have no awaiting caller; log so the error is not lost
+            log.error("stats refresh failed", extra={'collection': symbol, 'error': str(task.exception())})
+
+
+def floor_sol_from_stats(stats):
+    if not stats:
+        return None
+    floor_price = stats.get('floorPrice')
+    if not floor_price:
+        return None
+    try:
+        return float(floor_price) / LAMPORTS_PER_SOL
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,461 @@
+"""Per-user alert subscriptions with indexed matching.
+
+A subscription is a filter on one collection's events:
+
+- event type (listings, buys or both)
+- rarity tier
+- rank range
+- price range in SOL
+- price relative to the floor (``max_floor_ratio`` 1.0 = at or below floor)
+
+Matches are delivered by DM or in a thread. Subscriptions live in SQLite;
+matching runs against an in-memory index. Changes are layered on top of it
+until enough pile up; then a new index is built in a worker thread and
+swapped in, so a rebuild never stalls alert delivery:
+
+- Subscriptions are bucketed by (collection, event type, tier), so an event
+  only looks at the buckets it can match.
+- Each bucket is a segment tree over rank, so a rank lookup visits O(log n)
+  nodes.
+- Each node keeps its subscriptions sorted by ``price_max``; a bisect drops
+  every "under X SOL" filter the price is already above.
+
+Only the survivors get a per-subscription check. Benchmark it with::
+
+    python subscriptions.py bench [--subs 50000] [--events 20000]
+"""
+import argparse
+import asyncio
+import bisect
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import time
+from collections import namedtuple
+
+from metadata_cache import DATA_DIR
+from metrics import Counter, Histogram
+
+log = logging.getLogger('koru.subscriptions')
+
+SUBSCRIPTIONS_DB_PATH = os.path.join(DATA_DIR, 'subscriptions.sqlite3')
+
+SUBSCRIPTION_MATCHES = Counter('koru_subscription_matches_total', "Events matched to user subscriptions", ['collection'])
+MATCH_SECONDS = Histogram('koru_subscription_match_seconds', "Subscription matching time per event",
+                          buckets=(0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01))
+
+# event_type and tier are None for "any"; rank/price bounds are None when open
+Subscription = namedtuple('Subscription', [
+    'id', 'user_id', 'collection', 'event_type', 'tier', 'rank_min', 'rank_max',
+    'price_min', 'price_max', 'max_floor_ratio', 'delivery', 'thread_id',
+])
+
+DELIVERY_DM = 'dm'
+DELIVERY_THREAD = 'thread'
+
+# Events without a rank are looked up at rank 0, which only open rank ranges cover
+_NO_RANK = 0
+_RANK_INF = float('inf')
+
+
+def describe(sub):
+    """One-line summary of a subscription for ``/alert list``."""
+    parts = [{None: "listings and buys", 'list': "listings", 'buyNow': "buys"}[sub.event_type]]
+    if sub.tier:
+        parts.append(sub.tier)
+    if sub.rank_min is not None or sub.rank_max is not None:
+        parts.append(f"rank {sub.rank_min or 1}-{sub.rank_max if sub.rank_max is not None else '∞'}")
+    if sub.price_min is not None:
+        parts.append(f"≥ {sub.price_min:g} SOL")
+    if sub.price_max is not None:
+        parts.append(f"≤ {sub.price_max:g} SOL")
+    if sub.max_floor_ratio is not None:
+        parts.append(f"≤ {sub.max_floor_ratio * 100:g}% of floor")
+    where = "DM" if sub.delivery == DELIVERY_DM else f"<#{sub.thread_id}>"
+    return f"`#{sub.id}` {sub.collection}: {', '.join(parts)} → {where}"
+
+
+def wants(sub, collection, event_type, tier, rank, price, floor_sol):
+    """Check one subscription directly (the index gives the same answer, faster)."""
+    if sub.collection != collection or sub.event_type not in (None, event_type):
+        return False
+    if sub.tier is not None and sub.tier != tier:
+        return False
+    if sub.rank_min is not None and (rank is None or rank < sub.rank_min):
+        return False
+    if sub.rank_max is not None and (rank is None or rank > sub.rank_max):
+        return False
+    if price is None:
+        return sub.price_min is None and sub.price_max is None and sub.max_floor_ratio is None
+    if sub.price_min is not None and price < sub.price_min:
+        return False
+    if sub.price_max is not None and price > sub.price_max:
+        return False
+    if sub.max_floor_ratio is not None and (not floor_sol or price > floor_sol * sub.max_floor_ratio):
+        return False
+    return True
+
+
+class _RankTree:
+    """Static segment tree of subscriptions keyed by their rank interval."""
+
+    def __init__(self, subs):
+        bounds = set()
+        for sub in subs:
+            lo, hi = _rank_bounds(sub)
+            bounds.add(lo)
+            bounds.add(hi)
+        self.points = sorted(bounds)  # leaf i covers [points[i], points[i + 1])
+        self.size = 1
+        while self.size < max(len(self.points) - 1, 1):
+            self.size *= 2
+        nodes = [[] for _ in range(2 * self.size)]
+        for sub in subs:
+            lo, hi = _rank_bounds(sub)
+            left = bisect.bisect_left(self.points, lo) + self.size
+            right = bisect.bisect_left(self.points, hi) + self.size
+            while left < right:
+                if left & 1:
+                    nodes[left].append(sub)
+                    left += 1
+                if right & 1:
+                    right -= 1
+                    nodes[right].append(sub)
+                left //= 2
+                right //= 2
+        # Each node holds two groups sorted by price_max: filters that are fully
+        # decided by rank and price_max, and ones that still need a check
+        self.nodes = [None] * len(nodes)
+        for i, members in enumerate(nodes):
+            if members:
+                self.nodes[i] = (_price_sorted([s for s in members if not _needs_check(s)]),
+                                 _price_sorted([s for s in members if _needs_check(s)]))
+
+    def stab(self, rank, price, done, check):
+        """Collect subscriptions whose rank interval contains ``rank`` and price_max >= ``price``.
+
+        Fully matched ones go to ``done``, the rest to ``check``.
+        """
+        leaf = bisect.bisect_right(self.points, rank) - 1
+        if leaf < 0 or leaf >= len(self.points) - 1:
+            return
+        i = leaf + self.size
+        nodes = self.nodes
+        while i:
+            node = nodes[i]
+            if node is not None:
+                for (keys, members), out in zip(node, (done, check)):
+                    if members:
+                        out.extend(members[bisect.bisect_left(keys, price):])
+            i //= 2
+
+
+def _needs_check(sub):
+    return sub.price_min is not None or sub.max_floor_ratio is not None
+
+
+def _price_sorted(subs):
+    subs.sort(key=_price_max_key)
+    return [_price_max_key(s) for s in subs], subs
+
+
+def _rank_bounds(sub):
+    # Half-open [lo, hi); only a filter with no rank or tier covers unranked events
+    if sub.rank_min is not None:
+        lo = sub.rank_min
+    elif sub.rank_max is not None or sub.tier is not None:
+        lo = 1
+    else:
+        lo = _NO_RANK
+    hi = sub.rank_max + 1 if sub.rank_max is not None else _RANK_INF
+    return lo, hi
+
+
+def _price_max_key(sub):
+    return sub.price_max if sub.price_max is not None else _RANK_INF
+
+
+class SubscriptionIndex:
+    """Matching index over a fixed set of subscriptions."""
+
+    def __init__(self, subs):
+        buckets = {}
+        for sub in subs:
+            buckets.setdefault((sub.collection, sub.event_type, sub.tier), []).append(sub)
+        self._trees = {key: _RankTree(members) for key, members in buckets.items()}
+        self._len = len(subs)
+
+    def __len__(self):
+        return self._len
+
+    def match(self, collection, event_type, tier, rank, price, floor_sol):
+        """Subscriptions that want this event."""
+        rank = rank if rank is not None else _NO_RANK
+        # Without a price only filters with no price bound at all can match
+        key = price if price is not None else _RANK_INF
+        matched, check = [], []
+        for type_key in (None, event_type):
+            for tier_key in ((None, tier) if tier else (None,)):
+                tree = self._trees.get((collection, type_key, tier_key))
+                if tree is not None:
+                    tree.stab(rank, key, matched, check)
+        for sub in check:
+            if price is None:
+                continue
+            if sub.price_min is not None and price < sub.price_min:
+                continue
+            if sub.max_floor_ratio is not None and (not floor_sol or price > floor_sol * sub.max_floor_ratio):
+                continue
+            matched.append(sub)
+        return matched
+
+
+class SubscriptionStore:
+    # Changes are applied on top of the index until this many pile up, then it is rebuilt
+    REBUILD_AFTER = 256
+
+    def __init__(self, path=SUBSCRIPTIONS_DB_PATH, max_per_user=25):
+        self.path = path
+        self.max_per_user = max_per_user
+        self._db = None
+        self._index = None
+        self._added = []       # subscriptions added since the index was built
+        self._removed = set()  # ids removed since the index was built
+        self._rebuilding = None  # background rebuild task
+
+    def open(self):
+        if self._db is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, collection TEXT NOT NULL,"
+            " event_type TEXT, tier TEXT, rank_min INTEGER, rank_max INTEGER,"
+            " price_min REAL, price_max REAL, max_floor_ratio REAL,"
+            " delivery TEXT NOT NULL, thread_id INTEGER, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS subscriptions_user ON subscriptions (user_id)")
+        self._db.commit()
+        self._rebuild()
+
+    def close(self):
+        if self._rebuilding is not None:
+            self._rebuilding.cancel()
+            self._rebuilding = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+
+    def add(self, user_id, collection, event_type=None, tier=None, rank_min=None, rank_max=None,
+            price_min=None, price_max=None, max_floor_ratio=None, delivery=DELIVERY_DM, thread_id=None):
+        """Store a subscription and return it. Raises ValueError for an invalid filter."""
+        if rank_min is not None and rank_max is not None and rank_min > rank_max:
+            raise ValueError("rank_min is greater than rank_max")
+        if price_min is not None and price_max is not None and price_min > price_max:
+            raise ValueError("price_min is greater than price_max")
+        if delivery == DELIVERY_THREAD and thread_id is None:
+            raise ValueError("thread delivery needs a thread")
+        if len(self.for_user(user_id)) >= self.max_per_user:
+            raise ValueError(f"you already have {self.max_per_user} alerts")
+        with self._db:
+            cursor = self._db.execute(
+                "INSERT INTO subscriptions (user_id, collection, event_type, tier, rank_min, rank_max,"
+                " price_min, price_max, max_floor_ratio, delivery, thread_id, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, collection, event_type, tier, rank_min, rank_max, price_min, price_max,
+                 max_floor_ratio, delivery, thread_id, time.time()),
+            )
+        sub = Subscription(cursor.lastrowid, user_id, collection, event_type, tier, rank_min, rank_max,
+                           price_min, price_max, max_floor_ratio, delivery, thread_id)
+        self._added.append(sub)
+        self._changed()
+        return sub
+
+    def remove(self, user_id, sub_id):
+        """Delete one of ``user_id``'s subscriptions. Returns False if there was none."""
+        with self._db:
+            removed = self._db.execute(
+                "DELETE FROM subscriptions WHERE id = ? AND user_id = ?", (sub_id, user_id)
+            ).rowcount
+        if removed:
+            self._removed.add(sub_id)
+            self._changed()
+        return bool(removed)
+
+    def remove_thread(self, thread_id):
+        """Delete every subscription delivered to ``thread_id``. Returns how many there were."""
+        with self._db:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT id FROM subscriptions WHERE thread_id = ?", (thread_id,)
+            )]
+            self._db.execute("DELETE FROM subscriptions WHERE thread_id = ?", (thread_id,))
+        self._removed.update(ids)
+        self._changed()
+        return len(ids)
+
+    def for_user(self, user_id):
+        return [Subscription(*row) for row in self._db.execute(
+            f"SELECT {', '.join(Subscription._fields)} FROM subscriptions WHERE user_id = ? ORDER BY id", (user_id,)
+        )]
+
+    def all(self):
+        return [Subscription(*row) for row in self._db.execute(
+            f"SELECT {', '.join(Subscription._fields)} FROM subscriptions"
+        )]
+
+    def match(self, collection, event_type, tier, rank, price, floor_sol):
+        """Subscriptions that want this event."""
+        start = time.perf_counter()
+        matched = self._index.match(collection, event_type, tier, rank, price, floor_sol)
+        if self._added:
+            matched.extend(s for s in self._added if wants(s, collection, event_type, tier, rank, price, floor_sol))
+        if self._removed:
+            matched = [s for s in matched if s.id not in self._removed]
+        MATCH_SECONDS.observe(time.perf_counter() - start)
+        if matched:
+            SUBSCRIPTION_MATCHES.inc(len(matched), collection=collection)
+        return matched
+
+    def _changed(self):
+        if len(self._added) + len(self._removed) <= self.REBUILD_AFTER:
+            return
+        if self._rebuilding is not None and not self._rebuilding.done():
+            return
+        try:
+            self._rebuilding = asyncio.get_running_loop().create_task(self.rebuild())
+        except RuntimeError:
+            # No event loop (CLI tools): just rebuild in place
+            self._rebuild()
+
+    async def rebuild(self):
+        """Build a fresh index in a worker thread and swap it in.
+
+        ``match`` keeps using the old index meanwhile. Changes made during the
+        build stay layered on top of the new one.
+        """
+        added, removed = len(self._added), set(self._removed)
+        index, ids = await asyncio.to_thread(self._build_index)
+        self._index = index
+        # The snapshot may already hold some of the later additions
+        self._added = [sub for sub in self._added[added:] if sub.id not in ids]
+        self._removed -= removed
+        log.info("rebuilt subscription index", extra={'subscriptions': len(ids)})
+
+    def _build_index(self):
+        # Runs in a worker thread, so it reads through its own connection (WAL allows that)
+        db = sqlite3.connect(self.path)
+        try:
+            subs = [Subscription(*row) for row in db.execute(
+                f"SELECT {', '.join(Subscription._fields)} FROM subscriptions"
+            )]
+        finally:
+            db.close()
+        return SubscriptionIndex(subs), {sub.id for sub in subs}
+
+    def _rebuild(self):
+        self._index = SubscriptionIndex(self.all())
+        self._added = []
+        self._removed = set()
+
+
+def _random_subscription(rng, sub_id, collections, supply=3333):
+    from rarity_index import TIERS
+
+    rank_min = rank_max = price_min = price_max = ratio = tier = None
+    kind = rng.random()
+    if kind < 0.3:
+        tier = rng.choice(TIERS[:4])
+    elif kind < 0.6:
+        rank_max = rng.randint(10, supply // 2)
+        if rng.random() < 0.3:
+            rank_min = rng.randint(1, rank_max)
+    if rng.random() < 0.7:
+        price_max = round(rng.uniform(0.5, 20.0), 2)
+    if rng.random() < 0.2:
+        price_min = round(rng.uniform(0.1, 2.0), 2)
+    if rng.random() < 0.25:
+        ratio = rng.choice((0.8, 0.9, 1.0))
+    event_type = rng.choice((None, 'list', 'list', 'buyNow'))
+    return Subscription(sub_id, rng.randint(1, 10 ** 6), rng.choice(collections), event_type, tier,
+                        rank_min, rank_max, price_min, price_max, ratio, DELIVERY_DM, None)
+
+
+def bench(n_subs=50_000, n_events=20_000, seed=7, supply=3333):
+    """Time index build and per-event matching on random subscriptions and events."""
+    from rarity_index import TIERS
+
+    rng = random.Random(seed)
+    collections = ['koru', 'other']
+    subs = [_random_subscription(rng, i, collections, supply) for i in range(1, n_subs + 1)]
+    start = time.perf_counter()
+    index = SubscriptionIndex(subs)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    cutoffs = [(1, TIERS[0]), (5, TIERS[1]), (15, TIERS[2]), (35, TIERS[3]), (100, TIERS[4])]
+    timings, matches = [], 0
+    for _ in range(n_events):
+        rank = rng.randint(1, supply)
+        pct = rank / supply * 100
+        tier = next(name for cutoff, name in cutoffs if pct <= cutoff)
+        price = round(rng.uniform(0.5, 25.0), 3)
+        event_type = 'list' if rng.random() < 0.6 else 'buyNow'
+        t0 = time.perf_counter()
+        matched = index.match('koru', event_type, tier, rank, price, 1.5)
+        timings.append(time.perf_counter() - t0)
+        matches += len(matched)
+    timings.sort()
+
+    # Brute force on a sample to check the index returns exactly the same set
+    naive_ids = index_ids = 0
+    for _ in range(200):
+        rank, price = rng.randint(1, supply), rng.uniform(0.5, 25.0)
+        tier = next(name for cutoff, name in cutoffs if rank / supply * 100 <= cutoff)
+        want = {s.id for s in subs if wants(s, 'koru', 'list', tier, rank, price, 1.5)}
+        got = {s.id for s in index.match('koru', 'list', tier, rank, price, 1.5)}
+        assert want == got, (rank, price, tier, want ^ got)
+        naive_ids += len(want)
+        index_ids += len(got)
+    return {
+        'subs': n_subs,
+        'build_ms': build_ms,
+        'p50_us': timings[len(timings) // 2] * 1e6,
+        'p99_us': timings[int(len(timings) * 0.99)] * 1e6,
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'matches_per_event': matches / n_events,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Alert subscription tools.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    b = sub.add_parser('bench', help="benchmark indexed matching")
+    b.add_argument('--subs', type=int, default=50_000)
+    b.add_argument('--events', type=int, default=20_000)
+    s = sub.add_parser('stats', help="count stored subscriptions")
+    s.add_argument('--db', default=SUBSCRIPTIONS_DB_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        for n in sorted({1_000, 10_000, args.subs}):
+            r = bench(n, args.events)
+            print(f"{r['subs']:>7} subs: build {r['build_ms']:.0f} ms, match p50 {r['p50_us']:.1f} us, "
+                  f"p99 {r['p99_us']:.1f} us, mean {r['mean_us']:.1f} us, {r['matches_per_event']:.1f} matches/event")
+    elif args.command == 'stats':
+        store = SubscriptionStore(args.db)
+        store.open()
+        try:
+            print(f"{len(store)} subscriptions")
+        finally:
+            store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Circuit breaker recovery in ``MagicEdenClient`` against a scripted local server.
+
+Run with ``python -m pytest`` (or ``python -m unittest``) from the repo root.
+"""
+import asyncio
+import unittest
+
+from aiohttp import web
+
+from governor import RequestGovernor
+from me_client import CircuitOpenError, MagicEdenClient, MagicEdenError
+
+
+class ScriptedServer:
+    """Answers ``/v2/tokens/{mint}`` with the next queued status, then 200 once the script runs out."""
+
+    def __init__(self):
+        self.script = []
+        self.hold = None  # an asyncio.Event requests wait on before answering
+        self.calls = 0
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/v2/tokens/{mint}', self._token)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _token(self, request):
+        self.calls += 1
+        if self.hold is not None:
+            await self.hold.wait()
+        status = self.script.pop(0) if self.script else 200
+        if status == 200:
+            return web.json_response({'mintAddress': request.match_info['mint'], 'name': 'Koru #1'})
+        headers = {'Retry-After': '0'} if status == 429 else {}
+        return web.json_response({'error': status}, status=status, headers=headers)
+
+
+class CircuitBreakerRecoveryTest(unittest.IsolatedAsyncioTestCase):
+    reset_timeout = 0.2
+
+    async def asyncSetUp(self):
+        self.server = ScriptedServer()
+        governor = RequestGovernor(rate=1000, burst=1000, max_retries=0, base_delay=0.01,
+                                   failure_threshold=3, reset_timeout=self.reset_timeout)
+        self.client = MagicEdenClient(await self.server.start(), governor=governor)
+        await self.client.start()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+
+    async def open_breaker(self):
+        self.server.script = [503, 503, 503]
+        for _ in range(3):
+            with self.assertRaises(MagicEdenError):
+                await self.client.token('mint')
+        with self.assertRaises(CircuitOpenError):
+            await self.client.token('mint')
+        await asyncio.sleep(self.reset_timeout + 0.05)
+
+    async def test_trial_ending_in_429_lets_a_later_trial_close_the_breaker(self):
+        await self.open_breaker()
+        self.server.script = [429]
+        with self.assertRaises(MagicEdenError) as caught:
+            await self.client.token('mint')
+        self.assertEqual(caught.exception.status, 429)
+        # The server is healthy again; the next call is a fresh trial and closes the breaker
+        self.assertEqual((await self.client.token('mint'))['name'], 'Koru #1')
+        self.assertFalse(self.client.governor.breaker('token').is_open)
+
+    async def test_cancelled_trial_is_released(self):
+        await self.open_breaker()
+        self.server.hold = asyncio.Event()
+        trial = asyncio.create_task(self.client.token('mint'))
+        while self.server.calls < 4:
+            await asyncio.sleep(0.01)
+        trial.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+        self.server.hold.set()
+        self.assertEqual((await self.client.token('mint'))['name'], 'Koru #1')
+        self.assertFalse(self.client.governor.breaker('token').is_open)
+
+
+if __name__ == '__main__':
+    unittest.main()
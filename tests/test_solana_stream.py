@@ -0,0 +1,198 @@
+"""The Solana log stream against ``FakeSolanaRpc``: outages must end in a REST catch-up
+that announces every missed event exactly once.
+
+Run with ``python -m pytest`` (or ``python -m unittest``) from the repo root.
+"""
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+from dispatch import AlertDispatcher
+from fake_magiceden import FakeChannel, FakeMagicEden, FakeSolanaRpc
+from governor import RequestGovernor
+from ingest import event_key
+from journal import EventJournal
+from me_client import MagicEdenClient
+from metadata_cache import TokenMetadataCache
+from scheduler import AdaptiveInterval
+from solana_stream import LogStream
+from stats_cache import StatsCache
+from tracker import CollectionConfig, CollectionTracker, TrackerPool
+
+
+async def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        await asyncio.sleep(0.01)
+
+
+class StreamTestCase(unittest.IsolatedAsyncioTestCase):
+    """A tracker fed by ``LogStream`` over ``FakeSolanaRpc``, seeded with five past events."""
+    idle_timeout = 5.0
+
+    async def asyncSetUp(self):
+        self.fake = FakeMagicEden()
+        self.rpc = FakeSolanaRpc(self.fake)
+        self.client = MagicEdenClient(await self.fake.start(), governor=RequestGovernor(rate=1000, burst=1000))
+        await self.client.start()
+        await self.rpc.start()
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.token_meta = TokenMetadataCache(os.path.join(self.data_dir.name, 'meta.sqlite3'))
+        self.journal = EventJournal(os.path.join(self.data_dir.name, 'journal.sqlite3'))
+        self.token_meta.open()
+        self.journal.open()
+        self.channel = FakeChannel(1)
+        self.dispatcher = AlertDispatcher(lambda alerts: None)
+        config = CollectionConfig(slug=self.fake.symbol, name='Koru', channel_ids=[1], role_ids={}, rarity_file=None)
+        # Nothing polls on a timer here: every REST poll after the seed is a catch-up
+        self.tracker = CollectionTracker(
+            config, self.client, StatsCache(self.client), self.token_meta, self.journal, self.dispatcher,
+            {1: self.channel}.get, schedule=AdaptiveInterval(min_seconds=0.01, max_seconds=300, initial_seconds=300),
+        )
+        self.announced = []  # (event key, source) of every event handed to the dispatcher
+        queue_alerts = self.tracker._queue_alerts
+
+        async def record(channels, new_events, source):
+            self.announced.extend((event_key(item), source) for item in new_events)
+            return await queue_alerts(channels, new_events, source)
+
+        self.tracker._queue_alerts = record
+        self.pool = TrackerPool([self.tracker])
+        self.gaps = []
+
+        def on_gap(reason):
+            self.gaps.append(reason)
+            self.pool.catch_up()
+
+        self.stream = LogStream(
+            self.rpc.ws_url, self.rpc.http_url, dict.fromkeys(self.fake.mints, self.fake.symbol),
+            self.pool.push, on_gap, idle_timeout=self.idle_timeout, base_delay=0.02, max_delay=0.1,
+            gap_cooldown=0.0,
+        )
+        # The first poll seeds the journal with the existing history
+        self.fake.burst(5)
+        self.pool.start_due()
+        await wait_until(lambda: self.tracker.ingestor.high_water is not None)
+        self.stream.start()
+        await wait_until(lambda: self.stream.connected)
+
+    async def asyncTearDown(self):
+        await self.stream.close()
+        await self.pool.close()
+        await self.dispatcher.close()
+        await self.client.close()
+        await self.rpc.stop()
+        await self.fake.stop()
+        self.token_meta.close()
+        self.journal.close()
+        self.data_dir.cleanup()
+
+    async def settle(self, expected):
+        """Wait until ``expected`` events were announced and delivered, then check nothing came twice."""
+        await wait_until(lambda: len(self.announced) >= expected and self.channel.alerts_received >= expected)
+        await asyncio.sleep(0.2)  # room for a duplicate to show up
+        await self.dispatcher.join()
+        keys = [key for key, _ in self.announced]
+        self.assertEqual(len(keys), len(set(keys)), "an event was announced twice")
+        self.assertEqual(len(keys), expected)
+        self.assertEqual(self.channel.alerts_received, expected)
+
+    def sources(self, items):
+        keys = {event_key(item) for item in items}
+        return {source for key, source in self.announced if key in keys}
+
+
+class LogStreamTest(StreamTestCase):
+    async def test_events_arrive_over_the_stream(self):
+        added = self.fake.burst(6)
+        await self.settle(6)
+        self.assertEqual(self.sources(added), {'stream'})
+
+    async def test_dropped_socket_catches_up_over_rest(self):
+        self.rpc.muted = True
+        missed = self.fake.burst(4)
+        self.rpc.muted = False
+        await self.rpc.drop()
+        await wait_until(lambda: self.gaps.count('subscribed') >= 2)
+        await self.settle(4)
+        self.assertIn('closed', self.gaps)
+        self.assertEqual(self.sources(missed), {'rest'})
+        # The stream is back: later events come straight through it
+        later = self.fake.burst(3)
+        await self.settle(7)
+        self.assertEqual(self.sources(later), {'stream'})
+
+    async def test_malformed_frame_keeps_the_stream_alive(self):
+        subscribers = self.rpc.subscribers
+        self.rpc.send_raw('{"jsonrpc": "2.0", "method": "logsNotification", "params": {"result": {"value": {}}}}')
+        self.rpc.send_raw('[1, 2, 3]')
+        self.rpc.send_raw('not json')
+        await wait_until(lambda: self.gaps.count('malformed') >= 3)
+        self.assertTrue(self.stream.connected)
+        self.assertEqual(self.rpc.subscribers, subscribers)
+        added = self.fake.burst(3)
+        await self.settle(3)
+        self.assertEqual(self.sources(added), {'stream'})
+
+    async def test_unresolvable_transaction_catches_up_over_rest(self):
+        self.rpc.unresolvable = True
+        missed = self.fake.burst(2)
+        self.rpc.unresolvable = False
+        await wait_until(lambda: 'unresolved' in self.gaps)
+        await self.settle(2)
+        self.assertEqual(self.sources(missed), {'rest'})
+
+
+class IdleStreamTest(StreamTestCase):
+    # Short enough to fire mid-test, so the stream-only assertions of LogStreamTest would race it
+    idle_timeout = 0.3
+
+    async def test_silent_stream_catches_up_over_rest(self):
+        self.rpc.muted = True
+        missed = self.fake.burst(3)
+        await wait_until(lambda: 'idle' in self.gaps)
+        await self.settle(3)
+        self.assertEqual(self.sources(missed), {'rest'})
+        self.rpc.muted = False
+        await wait_until(lambda: self.stream.connected)
+        later = self.fake.burst(2)
+        await self.settle(5)
+        self.assertEqual(self.sources(later), {'stream'})
+
+
+class StreamDownPollingTest(unittest.IsolatedAsyncioTestCase):
+    """While the stream is down, REST polls must not back off even when they find nothing."""
+
+    async def asyncSetUp(self):
+        self.tracker = SimpleNamespace(
+            slug='koru', next_poll_at=0.0, poll=self.poll,
+            schedule=AdaptiveInterval(min_seconds=15, max_seconds=300, initial_seconds=120),
+        )
+        self.pool = TrackerPool([self.tracker])
+        self.pool.stream = SimpleNamespace(connected=False)
+
+    async def poll(self):
+        return 0
+
+    async def run_poll(self):
+        self.pool.catch_up()
+        await self.pool._running['koru']
+        return self.tracker.schedule.interval
+
+    async def test_empty_polls_stay_at_the_fastest_interval(self):
+        for _ in range(3):
+            self.assertEqual(await self.run_poll(), 15)
+
+    async def test_polls_back_off_once_the_stream_is_back(self):
+        await self.run_poll()
+        self.pool.stream.connected = True
+        self.assertGreater(await self.run_poll(), 15)
+
+
+if __name__ == '__main__':
+    unittest.main()
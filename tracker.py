@@ -0,0 +1,412 @@
+"""Per-collection tracking: config, state and the poll that turns activities into alerts.
+
+Collections are listed in ``collections.json`` (or ``$COLLECTIONS_FILE``)::
+
+    [
+      {
+        "slug": "koru",
+        "name": "Koru",
+        "channel_ids": [1393739742234939422],
+        "role_ids": {"mythic": 1394729409243643995},
+        "rarity_file": "rarity-ranking.json",
+        "hashlist_file": "hashlist.json"
+      }
+    ]
+
+Each collection gets its own ingestor, poll schedule and rarity index, while
+the HTTP client, caches, journal and dispatcher are shared. A deployment can
+be split across processes with ``SHARD_ID``/``SHARD_COUNT``; each process only
+tracks the collections whose slug hashes to its shard.
+
+``hashlist_file`` (a JSON list of mints) is optional; the Solana log stream
+needs it to tell which collection a traded mint belongs to.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import zlib
+from collections import namedtuple
+
+import discord
+
+from dispatch import Alert
+from ingest import ActivityIngestor, event_key
+from me_client import MagicEdenError
+from metrics import Counter, Gauge, Histogram
+from rarity_index import load_rarity_index
+from scheduler import AdaptiveInterval
+
+log = logging.getLogger('koru.tracker')
+
+TICK_SECONDS = Histogram('koru_tick_seconds', "Duration of one collection poll (ingest + build + queue)",
+                         ['collection'])
+EVENTS_FOUND = Counter('koru_events_found_total', "New activities found by polls and the log stream",
+                       ['collection', 'type', 'source'])
+POLL_INTERVAL = Gauge('koru_poll_interval_seconds', "Current adaptive poll interval", ['collection'])
+POLL_HIT_RATE = Gauge('koru_poll_hit_rate', "Fraction of recent polls that found new events", ['collection'])
+
+CollectionConfig = namedtuple(
+    'CollectionConfig', ['slug', 'name', 'channel_ids', 'role_ids', 'rarity_file', 'hashlist_file'],
+    defaults=(None,),
+)
+
+# Tier emojis for rarity
+tier_emojis = {
+    "Mythic": "🟣",
+    "Legendary": "🟡",
+    "Epic": "🟢",
+    "Rare": "🔵",
+    "Common": "⚪"
+}
+
+# Rarity color hex codes for embeds
+rarity_colors = {
+    "Mythic": "#a98dd6",     # 🟣
+    "Legendary": "#FFD700",  # 🟡
+    "Epic": "#77b058",       # 🟢
+    "Rare": "#55abed",       # 🔵
+    "Common": "#FFFFFF"      # ⚪
+}
+
+def get_rarity_color(rarity):
+    return int(rarity_colors.get(rarity, "#2ecc71").lstrip('#'), 16)
+
+
+def load_collection_configs(path, default):
+    """Read collection configs from ``path``; fall back to ``[default]`` if it does not exist."""
+    if not os.path.exists(path):
+        return [default]
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    configs = []
+    for entry in entries:
+        rarity_file, hashlist_file = entry.get('rarity_file'), entry.get('hashlist_file')
+        if rarity_file and not os.path.isabs(rarity_file):
+            rarity_file = os.path.join(base_dir, rarity_file)
+        if hashlist_file and not os.path.isabs(hashlist_file):
+            hashlist_file = os.path.join(base_dir, hashlist_file)
+        configs.append(CollectionConfig(
+            slug=entry['slug'],
+            name=entry.get('name') or entry['slug'].title(),
+            channel_ids=[int(cid) for cid in entry.get('channel_ids', [])],
+            role_ids={tier.lower(): int(rid) for tier, rid in (entry.get('role_ids') or {}).items()},
+            rarity_file=rarity_file,
+            hashlist_file=hashlist_file,
+        ))
+    return configs
+
+
+def shard_of(slug, shard_count):
+    """Stable shard number for a collection slug (same in every process)."""
+    return zlib.crc32(slug.encode('utf-8')) % shard_count
+
+
+class CollectionTracker:
+    """State and poll logic for one collection."""
+
+    def __init__(self, config, client, stats_cache, token_meta, journal, dispatcher, get_channel,
+                 page_size=100, max_pages=5, schedule=None, subscriptions=None, get_target=None, market=None):
+        """``subscriptions`` (a SubscriptionStore) and ``get_target(sub)`` enable per-user alerts;
+        ``get_target`` returns the DM channel or thread to send a matched alert to, or None.
+        ``market`` (an analytics.MarketSeries) records every new sale and listing."""
+        self.config = config
+        self.slug = config.slug
+        self.client = client
+        self.stats_cache = stats_cache
+        self.token_meta = token_meta
+        self.journal = journal
+        self.dispatcher = dispatcher
+        self.get_channel = get_channel
+        self.subscriptions = subscriptions
+        self.get_target = get_target
+        self.market = market
+        self.ingestor = ActivityIngestor(client, config.slug, page_size=page_size, max_pages=max_pages)
+        self.schedule = schedule or AdaptiveInterval()
+        self.next_poll_at = 0.0
+        # Polls and stream pushes may carry the same event; only one may announce at a time
+        self._announce_lock = asyncio.Lock()
+        self.rarity = None
+        if config.rarity_file:
+            try:
+                self.rarity = load_rarity_index(config.rarity_file)
+            except Exception as e:
+                log.error("could not load rarity data", extra={'collection': self.slug, 'error': str(e)})
+        POLL_INTERVAL.set_function(lambda: self.schedule.interval, collection=self.slug)
+        POLL_HIT_RATE.set_function(lambda: self.schedule.hit_rate, collection=self.slug)
+
+    def restore(self):
+        """Load the ingestion high-water mark saved by a previous run."""
+        self.ingestor.high_water = self.journal.get_meta(f"high_water:{self.slug}")
+
+    async def poll(self):
+        """Run one ingestion pass and queue alerts. Returns the number of new events."""
+        start = time.perf_counter()
+        try:
+            return await self._poll()
+        finally:
+            TICK_SECONDS.observe(time.perf_counter() - start, collection=self.slug)
+
+    async def push(self, items):
+        """Announce activities delivered by the Solana log stream (same shape as REST activities).
+
+        Returns the number of new events. Until the first REST poll has run,
+        pushes are ignored: that poll seeds the journal or catches up itself.
+        """
+        if self.ingestor.high_water is None:
+            return 0
+        channels = self._channels()
+        if channels is None:
+            return 0
+        return await self._announce(channels, items, 'stream')
+
+    def _channels(self):
+        channel_ids = self.config.channel_ids
+        channels = [self.get_channel(cid) for cid in channel_ids]
+        if not any(channels):
+            log.error("none of the configured channels were found", extra={'collection': self.slug, 'channels': channel_ids})
+            return None
+        return channels
+
+    async def _poll(self):
+        channels = self._channels()
+        if channels is None:
+            return 0
+        # Page back through activities to the last high-water mark and filter by type in code
+        try:
+            # A brand-new journal has nothing to dedupe against; seed it instead of announcing
+            seeding = self.ingestor.high_water is None and self.journal.is_empty(self.slug)
+            data = await self.ingestor.poll(self.journal.seen)
+        except MagicEdenError as e:
+            log.error("failed to fetch activities", extra={'collection': self.slug, 'status': e.status, 'error': str(e)})
+            return 0
+        except Exception as e:
+            log.error("failed to fetch activities", extra={'collection': self.slug, 'error': str(e)})
+            return 0
+        self.journal.set_meta(f"high_water:{self.slug}", self.ingestor.high_water)
+        if seeding:
+            self.journal.record_many(self.slug, [(event_key(item), item) for item in data])
+            log.info("seeded event journal; nothing announced", extra={'collection': self.slug, 'events': len(data)})
+            return 0
+        return await self._announce(channels, data, 'rest')
+
+    async def _announce(self, channels, data, source):
+        async with self._announce_lock:
+            # Collect new listings and buys (already oldest first). The journal is checked
+            # again here: the other source may have announced the same event meanwhile
+            new_events = [
+                item for item in data
+                if item.get('tokenMint') and item.get('type') in ('list', 'buyNow')
+                and not self.journal.seen(event_key(item))
+            ]
+            if not new_events:
+                log.debug("no new listings or buys", extra={'collection': self.slug, 'source': source})
+                return 0
+            for item in new_events:
+                EVENTS_FOUND.inc(collection=self.slug, type=item['type'], source=source)
+            # Recorded before the alerts are built so the other source skips them straight away
+            self.journal.record_many(self.slug, [(event_key(item), item) for item in new_events])
+        return await self._queue_alerts(channels, new_events, source)
+
+    async def _queue_alerts(self, channels, new_events, source):
+        # One stats lookup per tick (served from the TTL cache) instead of one per event
+        floor_sol = await self.stats_cache.floor_sol(self.slug)
+        # Alerts are built first and queued together so the dispatcher can pack them.
+        # Metadata lookups run concurrently; the client's governor paces the requests
+        alerts = await asyncio.gather(*(
+            self._listing_alert(item, floor_sol) if item['type'] == 'list' else self._buy_alert(item, floor_sol)
+            for item in new_events
+        ))
+        self.dispatcher.submit(channels, alerts)
+        if self.market is not None:
+            for item, alert in zip(new_events, alerts):
+                self.market.record(alert.kind, item.get('blockTime') or time.time(), alert.price, alert.tier)
+        if self.subscriptions is not None:
+            await self._deliver_subscriptions(alerts)
+        log.info("queued alerts", extra={'collection': self.slug, 'alerts': len(alerts), 'source': source,
+                                          'queue_depth': self.dispatcher.total_depth()})
+        return len(alerts)
+
+    async def _describe_token(self, mint, item):
+        """Name, image, rarity line, tier and embed colour for one activity."""
+        # Prefer name and image from the activity, fall back to the metadata cache
+        meta = await self.token_meta.resolve(self.client, mint, item.get('name'), item.get('image'))
+        name, image = meta.name, meta.image
+        if not name:
+            name = f"NFT {mint[:6]}..."
+        # Lookup rarity info
+        rarity_str, tier, rank, color = '', None, None, None
+        rarity = self.rarity.get(meta.number) if self.rarity else None
+        if rarity:
+            tier, rank = rarity.tier, rarity.rank
+            emoji = tier_emojis.get(tier, '')
+            rarity_str = f"**Rarity:** {emoji} {tier} | **Rank:** {rarity.rank}"
+            color = get_rarity_color(tier)
+        elif meta.number is not None:
+            rarity_str = "**Rarity:** Unknown | **Rank:** N/A"
+        return name, image, rarity_str, tier, rank, color
+
+    async def _deliver_subscriptions(self, alerts):
+        """Queue each alert for the users whose subscriptions match it, once per DM or thread."""
+        matches = [
+            (alert, self.subscriptions.match(self.slug, alert.kind, alert.tier, alert.rank, alert.price, alert.floor_sol))
+            for alert in alerts
+        ]
+        # Each DM or thread is resolved once, and all of them at the same time, instead of one lookup per match
+        wanted = {}  # (delivery, user or thread id) -> a subscription delivered there
+        for _, matched in matches:
+            for sub in matched:
+                wanted.setdefault(_target_key(sub), sub)
+        resolved = await asyncio.gather(*(self.get_target(sub) for sub in wanted.values()))
+        targets = dict(zip(wanted, resolved))
+        outgoing = {}  # target id -> (target, delivery, [alerts])
+        for alert, matched in matches:
+            per_target = {}  # target id -> (target, delivery, user ids to ping)
+            for sub in matched:
+                target = targets[_target_key(sub)]
+                if target is None:
+                    continue
+                _, _, user_ids = per_target.setdefault(target.id, (target, sub.delivery, []))
+                # DMs notify on their own; in a thread the subscriber is pinged
+                if sub.delivery == 'thread' and sub.user_id not in user_ids:
+                    user_ids.append(sub.user_id)
+            for target_id, (target, delivery, user_ids) in per_target.items():
+                mention = " ".join(f"<@{user_id}>" for user_id in user_ids) or None
+                outgoing.setdefault(target_id, (target, delivery, []))[2].append(alert._replace(mention=mention))
+        for target, delivery, target_alerts in outgoing.values():
+            # Labelled 'dm' or 'thread' rather than by channel id, which would grow with every subscriber
+            self.dispatcher.submit([target], target_alerts, label=delivery)
+        if outgoing and log.isEnabledFor(logging.DEBUG):
+            log.debug("queued subscription alerts", extra={'collection': self.slug, 'targets': len(outgoing)})
+
+    async def _listing_alert(self, item, floor_sol):
+        mint = item['tokenMint']
+        price = item.get('price', 'N/A')
+        lister = item.get('seller', 'Unknown')
+        lister_link = f'https://solscan.io/account/{lister}' if lister != 'Unknown' else None
+        name, image, rarity_str, tier, rank, color = await self._describe_token(mint, item)
+
+        # Build embed
+        lister_display = f"[Seller]({lister_link})" if lister_link else '`Unknown`'
+        desc = f"**Price:** {price} SOL"
+        if rarity_str:
+            desc += f"\n{rarity_str}"
+        desc += f"\n\n{lister_display}"
+        # Add rarity role ping if valid tier and role ID
+        role_mention = None
+        role_id = self.config.role_ids.get(tier.lower()) if tier else None
+        if role_id:
+            role_mention = f"<@&{role_id}>"
+
+        embed = discord.Embed(
+            title=f"🔥 New Listing: {name}",
+            description=desc,
+            color=color if color is not None else 0x2ecc71  # default green
+        )
+        if image:
+            embed.set_image(url=image)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("queued listing", extra={'collection': self.slug, 'nft': name, 'price': price})
+        return Alert(embed, mint, name, floor_sol, role_mention, 'list', tier, rank, _price_sol(price))
+
+    async def _buy_alert(self, item, floor_sol):
+        mint = item['tokenMint']
+        price = item.get('price', 'N/A')
+        buyer = item.get('buyer', 'Unknown')
+        buyer_link = f'https://solscan.io/account/{buyer}' if buyer != 'Unknown' else None
+        name, image, rarity_str, tier, rank, color = await self._describe_token(mint, item)
+
+        buyer_display = f"[Buyer]({buyer_link})" if buyer_link else '`Unknown`'
+        seller = item.get('seller', 'Unknown')
+        seller_link = f'https://solscan.io/account/{seller}' if seller != 'Unknown' else None
+        seller_display = f"[Seller]({seller_link})" if seller_link else '`Unknown`'
+        desc = f"**Sold for:** {price} SOL"
+        if rarity_str:
+            desc += f"\n{rarity_str}"
+        desc += f"\n\n{seller_display} 🤝 {buyer_display}"
+        embed = discord.Embed(
+            title=f"🎉 New Buy: {name}",
+            description=desc,
+            color=color if color is not None else 0xe67e22  # default orange
+        )
+        if image:
+            embed.set_image(url=image)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("queued buy", extra={'collection': self.slug, 'nft': name, 'price': price, 'buyer': buyer})
+        return Alert(embed, mint, name, floor_sol, None, 'buyNow', tier, rank, _price_sol(price))
+
+
+def _price_sol(price):
+    try:
+        return float(price)
+    except (TypeError, ValueError):
+        return None
+
+
+def _target_key(sub):
+    """Subscriptions with the same key are delivered to the same DM or thread."""
+    return (sub.delivery, sub.thread_id if sub.delivery == 'thread' else sub.user_id)
+
+
+class TrackerPool:
+    """Runs each tracker on its own adaptive schedule with a global concurrency cap."""
+
+    def __init__(self, trackers, max_concurrent=4):
+        self.trackers = {tracker.slug: tracker for tracker in trackers}
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._running = {}  # slug -> asyncio.Task
+        # The LogStream feeding ``push``, if any; while it is down every tracker polls at its fastest
+        self.stream = None
+
+    def start_due(self):
+        """Start a poll for every tracker whose interval has elapsed and is not already polling."""
+        now = time.monotonic()
+        for slug, tracker in self.trackers.items():
+            if tracker.next_poll_at > now:
+                continue
+            task = self._running.get(slug)
+            if task is not None and not task.done():
+                continue
+            self._running[slug] = asyncio.create_task(self._run(tracker))
+
+    async def _run(self, tracker):
+        async with self._semaphore:
+            try:
+                found = await tracker.poll()
+            except Exception:
+                log.exception("poll crashed", extra={'collection': tracker.slug})
+                found = 0
+        # Poll faster while events are flowing, back off exponentially while idle
+        interval = tracker.schedule.record(found)
+        if self.stream is not None and not self.stream.connected:
+            # REST is the only source until the stream is back
+            interval = tracker.schedule.interval = tracker.schedule.min_seconds
+        tracker.next_poll_at = time.monotonic() + interval
+        log.debug("poll scheduled", extra={'collection': tracker.slug, 'interval': round(interval, 1),
+                                           'hit_rate': round(tracker.schedule.hit_rate, 2)})
+
+    async def push(self, slug, items):
+        """Hand activities from the log stream to the collection's tracker."""
+        tracker = self.trackers.get(slug)
+        if tracker is None:
+            return 0
+        try:
+            return await tracker.push(items)
+        except Exception:
+            log.exception("push crashed", extra={'collection': slug})
+            return 0
+
+    def catch_up(self):
+        """Poll every collection now and on the fastest schedule, e.g. after the log stream dropped."""
+        for tracker in self.trackers.values():
+            tracker.schedule.interval = tracker.schedule.min_seconds
+            tracker.next_poll_at = 0.0
+        self.start_due()
+
+    async def close(self):
+        for task in self._running.values():
+            task.cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        self._running.clear()